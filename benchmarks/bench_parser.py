@@ -0,0 +1,77 @@
+#! /usr/bin/env python
+"""Compare parse_nmea_sentence (str + regex) against parse_nmea_bytes and
+parse_nmea_batch on a synthetic corpus of GGA/RMC/GSA/GSV/VTG sentences.
+
+Run from the repository root: python benchmarks/bench_parser.py
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from libnmea_navsat_driver.parser import parse_nmea_sentence, parse_nmea_bytes, \
+    parse_nmea_batch
+
+
+def with_checksum(body):
+    checksum = 0
+    for c in body:
+        checksum ^= ord(c)
+    return "$%s*%02X" % (body, checksum)
+
+
+def make_corpus(epochs=1000):
+    """One epoch per 0.1 s, the same sentence mix a u-blox M8 sends"""
+    corpus = []
+    for i in range(epochs):
+        seconds = 20000.0 + 0.1 * i
+        hhmmss = "%02d%02d%05.2f" % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+        corpus.append(with_checksum(
+            "GPRMC,%s,A,4016.0338,N,11138.1314,W,0.319,235.6,180918,,,A" % hhmmss))
+        corpus.append(with_checksum("GPVTG,235.6,T,,M,0.319,N,0.591,K,A"))
+        corpus.append(with_checksum(
+            "GPGGA,%s,4016.0338,N,11138.1314,W,1,10,0.99,1491.1,M,-16.6,M,," % hhmmss))
+        corpus.append(with_checksum("GPGSA,A,3,10,32,14,18,24,20,25,12,31,,,,1.70,0.99,1.38"))
+        corpus.append(with_checksum("GPGSV,3,1,11,10,51,305,39,12,29,098,33,14,52,055,41,18,11,316,29"))
+    return corpus
+
+
+def main():
+    corpus = make_corpus()
+    corpus_bytes = [line.encode('ascii') for line in corpus]
+    capture = b''.join(line + b'\r\n' for line in corpus_bytes)
+
+    for line, line_bytes in zip(corpus, corpus_bytes):
+        expected = parse_nmea_sentence(line)
+        parsed = parse_nmea_bytes(line_bytes)
+        for sentence_type in expected:
+            assert repr(expected[sentence_type]) == repr(dict(parsed[sentence_type]))
+
+    def run_str():
+        for line in corpus:
+            parse_nmea_sentence(line)
+
+    def run_decode():
+        # what gpslog used to do: decode every serial line first
+        for line in corpus_bytes:
+            parse_nmea_sentence(line.decode())
+
+    def run_bytes():
+        for line in corpus_bytes:
+            parse_nmea_bytes(line)
+
+    def run_batch():
+        parse_nmea_batch(capture)
+
+    for name, func in [("parse_nmea_sentence", run_str),
+                       ("decode + parse_nmea_sentence", run_decode),
+                       ("parse_nmea_bytes", run_bytes),
+                       ("parse_nmea_batch", run_batch)]:
+        best = min(timeit.repeat(func, number=5, repeat=5)) / 5
+        print("%-30s %8.2f us/sentence" % (name, 1e6 * best / len(corpus)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#! /usr/bin/env python
+"""How quickly gpslog.py starts logging, and the cost of the boundary check
+on each fix.
+
+Times a bare interpreter, importing numpy, importing gpslog, and a complete
+gpslog run over a one-epoch --replay (start, log the first fix, exit), each
+in a fresh process. Then compares the scalar math ellipse() against the
+numpy version it replaced, and the geofence ellipse() uses underneath.
+
+Run from the repository root: python benchmarks/bench_startup.py
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from bench_parser import make_corpus
+from libnmea_navsat_driver.capture import CaptureWriter
+
+
+def run_time(args, cwd=None, repeat=10):
+    """Best and median wall time of a fresh python process"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=cwd, check=True,
+                       stdout=subprocess.DEVNULL, env=dict(os.environ, PYTHONPATH=ROOT))
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[0], times[len(times) // 2]
+
+
+def numpy_ellipse(pt, center, R, theta):
+    import numpy as np
+    from math import pi
+    EARTH_RADIUS = 6371000.0
+    dy = EARTH_RADIUS*(pt[0] - center[0])*pi/180.0
+    dx = EARTH_RADIUS*np.cos(center[0]*pi/180.0)*(pt[1] - center[1])*pi/180.0
+    np.linalg.norm([dy, dx])
+    ct = np.cos(theta)
+    st = np.sin(theta)
+    return ((dx*ct + dy*st)/R[0])**2 + ((dx*st - dy*ct)/R[1])**2
+
+
+def main():
+    print("Startup (fresh process)            best ms  median ms")
+    for name, args in [
+            ("python -c pass", ['-c', 'pass']),
+            ("import numpy", ['-c', 'import numpy']),
+            ("import gpslog", ['-c', 'import gpslog'])]:
+        best, median = run_time(args)
+        print("  %-32s%9.1f%11.1f" % (name, best * 1e3, median * 1e3))
+
+    workdir = tempfile.mkdtemp()
+    capture = os.path.join(workdir, 'epoch.raw')
+    writer = CaptureWriter(capture)
+    writer.write(0.0, ("\r\n".join(make_corpus(1)) + "\r\n").encode())
+    writer.close()
+    best, median = run_time([os.path.join(ROOT, 'gpslog.py'), '--replay', capture],
+                            cwd=workdir, repeat=5)
+    print("  %-32s%9.1f%11.1f" % ("gpslog --replay, one fix", best * 1e3, median * 1e3))
+
+    import gpslog
+    logger = gpslog.gpslogger.__new__(gpslog.gpslogger)
+    logger.initializevariables()
+    pt = [40.2675, -111.6352]
+    n = 100000
+    t_math = timeit.timeit(lambda: logger.ellipse(pt), number=n) / n
+    t_numpy = timeit.timeit(lambda: numpy_ellipse(pt, logger.bdy_center, logger.bdy_R,
+                                                  logger.bdy_theta), number=n) / n
+    print("")
+    print("ellipse() per fix: math %.2f us, numpy %.2f us (%.1fx)"
+          % (t_math * 1e6, t_numpy * 1e6, t_numpy / t_math))
+    fence = logger.geofence
+    t_fence = timeit.timeit(lambda: fence.value(pt[0], pt[1]), number=n) / n
+    print("EllipseGeofence.value() per fix: %.2f us" % (t_fence * 1e6))
+    assert abs(logger.ellipse(pt) - numpy_ellipse(pt, logger.bdy_center, logger.bdy_R,
+                                                  logger.bdy_theta)) < 1e-9
+
+
+if __name__ == '__main__':
+    main()
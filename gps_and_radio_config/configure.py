@@ -4,7 +4,10 @@ import atcommander
 import sys
 import time
 
-def configure(port, gpsbaudrate=9600, radiobaudrate=57600, newbaudrate=57600, retries = 3):
+def configure(port, gpsbaudrate=9600, radiobaudrate=57600, newbaudrate=57600, retries = 3, protocol='nmea'):
+
+    if protocol not in ('nmea', 'ubx'):
+        raise ValueError("Unknown protocol %r, expected 'nmea' or 'ubx'" % protocol)
 
     # Binary GPS Config Messages
 
@@ -18,6 +21,11 @@ def configure(port, gpsbaudrate=9600, radiobaudrate=57600, newbaudrate=57600, re
     UBX_CFG_NAV5='06 24 24 00 ff ff 06 03 00 00 00 00 10 27 00 00 05 00 fa 00 fa 00 64 00 2c 01 00 00 00 00 10 27 00 00 00 00 00 00 00 00'
     UBX_CFG_CFG_SAVE='06 09 0d 00 00 00 00 00 ff ff 00 00 00 00 00 00 03'
 
+    # Output messages for protocol='ubx': NAV-PVT once per epoch on UART1 and
+    # the default NMEA sentences (GGA, GLL, GSA, GSV, RMC, VTG) switched off
+    UBX_CFG_MSG_NAV_PVT='06 01 08 00 01 07 00 01 00 00 00 00'
+    UBX_CFG_MSG_NMEA_OFF=['06 01 08 00 f0 %02x 00 00 00 00 00 00' % msgid for msgid in range(6)]
+
     # Test baudrate and fix if necessary
     print('Checking Baud Rate Settings...')
     for i in range(retries):
@@ -78,6 +86,18 @@ def configure(port, gpsbaudrate=9600, radiobaudrate=57600, newbaudrate=57600, re
         if not fail2:
             break
 
+    # Switch output to UBX-NAV-PVT
+    fail4 = False
+    if protocol == 'ubx':
+        print('Configuring GPS output messages (UBX NAV-PVT)...')
+        for message in [UBX_CFG_MSG_NAV_PVT] + UBX_CFG_MSG_NMEA_OFF:
+            for i in range(retries):
+                fail4 = ubx.send_ubx(message)
+                if not fail4:
+                    break
+            if fail4:
+                break
+
     # Save settings to GPS
     print('Saving GPS settings...')
     for i in range(retries):
@@ -86,7 +106,7 @@ def configure(port, gpsbaudrate=9600, radiobaudrate=57600, newbaudrate=57600, re
             break
 
     fail = False
-    if fail1 or fail2 or fail3:
+    if fail1 or fail2 or fail3 or fail4:
         fail = True
         print('Configuration Failed. Check to make sure the system is powered ' \
             'and the right port is specified')
@@ -141,6 +161,8 @@ def newradiobaudrate(port, oldbaudrate, newbaudrate, retries = 3):
 if __name__ == '__main__':
     if len(sys.argv) < 2:
         print('Please specify the port (e.g. python configure.py /dev/ttyUSB0)')
+        print('Add ubx to switch the GPS to UBX NAV-PVT output (e.g. python configure.py /dev/ttyUSB0 ubx)')
     else:
         serial_port = sys.argv[1]
-        configure(serial_port)
+        protocol = sys.argv[2] if len(sys.argv) > 2 else 'nmea'
+        configure(serial_port, protocol=protocol)
@@ -1,13 +1,22 @@
 #! /usr/bin/env python
 
 # import modules
+# (modules only some options need are imported where they are used, so the
+# script starts logging quickly)
+import argparse
+import os
 import serial
 import sys
 import time
-import warnings
-from math import pi, isnan
-import numpy as np
+from math import pi, isnan, cos, hypot
 import libnmea_navsat_driver.driver
+import libnmea_navsat_driver.framer
+import libnmea_navsat_driver.logwriter
+import libnmea_navsat_driver.reader
+from libnmea_navsat_driver.geofence import EllipseGeofence
+
+EARTH_RADIUS = 6371000.0
+DEG2RAD = pi/180.0
 
 
 class gpslogger:
@@ -47,20 +56,17 @@ class gpslogger:
         """
 
         # ---- print GPS state -----
-        if self.counter%10 == 0:  # reprint the titles every 10 iterations
-            print("time,fix,NumSat,lat,lon,alt,speed,ground_course,covariance")
-
-        print(time,fix,NumSat,lat,lon,alt,speed,ground_course,covariance)
+        self.showfix(time,fix,NumSat,lat,lon,alt,speed,ground_course,covariance)
 
 
         # ---- boundary checks ----
 
         ell = self.ellipse([lat, lon])
         if ell > 1.0:
-            print("ALERT!  Out of bounds! Return immediately!")
+            self.alert("ALERT!  Out of bounds! Return immediately!")
             return
         elif ell > 0.7:
-            print("WARNING!  Close to boundary! Ready pilot.")
+            self.alert("WARNING!  Close to boundary! Ready pilot.")
             return
 
         # --- update counter ---
@@ -71,64 +77,375 @@ class gpslogger:
 
     def distance(self, pt1, pt2):
         """pt = [lat, long]"""
-        EARTH_RADIUS = 6371000.0
-        distN = EARTH_RADIUS*(pt2[0] - pt1[0])*pi/180.0
-        distE = EARTH_RADIUS*np.cos(pt1[0]*pi/180.0)*(pt2[1] - pt1[1])*pi/180.0
-        return distE, distN, np.linalg.norm([distN, distE])
+        distN = EARTH_RADIUS*(pt2[0] - pt1[0])*DEG2RAD
+        distE = EARTH_RADIUS*cos(pt1[0]*DEG2RAD)*(pt2[1] - pt1[1])*DEG2RAD
+        return distE, distN, hypot(distN, distE)
 
 
     def ellipse(self, pt):
         """check if point is outside of boundary ellipse (ell > 1)"""
 
-        center = self.bdy_center
-        R = self.bdy_R
-        theta = self.bdy_theta
+        # the ellipse is compiled into a geofence, which is only rebuilt when
+        # bdy_center, bdy_R or bdy_theta change
+        fence = getattr(self, 'geofence', None)
+        if (fence is None or fence.theta != self.bdy_theta or
+                fence.center != self.bdy_center or fence.R != self.bdy_R):
+            fence = self.geofence = EllipseGeofence(self.bdy_center, self.bdy_R, self.bdy_theta)
+        return fence.value(pt[0], pt[1])
 
-        dx, dy, _ = self.distance(center, pt)
-        ct = np.cos(theta)
-        st = np.sin(theta)
-        ell = ((dx*ct + dy*st)/R[0])**2 + ((dx*st - dy*ct)/R[1])**2
 
-        return ell
+    def showfix(self, *fix):
+        """print the fix, or with --status pass it to the status display"""
 
+        if self.display is not None:
+            self.display.update(fix)
+            return
+        if self.shown%10 == 0:  # reprint the titles every 10 fixes
+            print("time,fix,NumSat,lat,lon,alt,speed,ground_course,covariance")
+        print(*fix)
+        self.shown += 1
 
-    def startgpslog(self):
 
-        # parse arguments
+    def alert(self, message):
+        """print a message right away (with --status, above the status display)"""
+
+        if self.display is not None:
+            self.display.alert(message)
+        else:
+            print(message)
+
+
+    def addhandler(self, handler, mode='inline', budget_ms=None, name=None):
+        """Call handler(fix) for every fix, after usrfun and logging.
+        mode 'inline' calls it right away, 'thread' or 'process' in a pool of
+        workers, so slow analytics can't hold up usrfun's boundary checks. Calls
+        taking longer than budget_ms are reported. Call from initializevariables."""
+
+        if getattr(self, 'handlers', None) is None:
+            from libnmea_navsat_driver.callbacks import FixHandlers
+            self.handlers = FixHandlers()
+        self.handlers.register(handler, mode, None if budget_ms is None else budget_ms/1000.0, name)
+
+
+    def startdisplay(self, args, counters):
+
+        self.display = None
+        self.shown = 0
+        self.handlers = getattr(self, 'handlers', None)
+        if args.status:
+            from libnmea_navsat_driver.status import StatusDisplay
+            self.display = StatusDisplay(rate=args.status_rate, counters=counters)
+            self.display.start()
+            if self.handlers is not None:
+                self.handlers.on_overrun = lambda stats, elapsed: self.display.alert(
+                    "%s took %.1f ms, over its %.1f ms budget (%d overruns so far)" %
+                    (stats.name, elapsed*1e3, stats.budget*1e3, stats.overruns))
+
+
+    def stopdisplay(self):
+
+        if self.display is not None:
+            self.display.stop()
+        if self.handlers is not None:
+            self.handlers.close(wait=False)
+            print(self.handlers.report())
+
+
+    def parsearguments(self):
+
         if len(sys.argv) < 2:
             print('Please specify the port (e.g. python gpslog.py /dev/ttyUSB0)')
             sys.exit(0)
+
+        parser = argparse.ArgumentParser(description='Read serial GPS data and write it to a time-stamped csv file.')
+        parser.add_argument('port', nargs='*',
+            help='serial port, e.g. /dev/ttyUSB0 or COM3; give several to log them all at once')
+        parser.add_argument('--threaded', action='store_true',
+            help='read the port on its own thread, so a slow usrfun cannot make the serial buffer overflow')
+        parser.add_argument('--queue-size', type=int, default=64,
+            help='fixes queued between the reader thread and usrfun (default 64)')
+        parser.add_argument('--queue-policy', default='drop-oldest',
+            choices=libnmea_navsat_driver.reader.FixQueue.POLICIES,
+            help='what to do when the queue is full (default drop-oldest; latest keeps only the newest fix; a --replay always blocks)')
+        parser.add_argument('--asyncio', action='store_true',
+            help='run on an asyncio event loop; usrfun may then be a coroutine (async def)')
+        parser.add_argument('--heartbeat', type=float, default=0,
+            help='with --asyncio, print a status line every this many seconds')
+        parser.add_argument('--epochs', action='store_true',
+            help='give usrfun one fix per navigation epoch, merged from its GGA, RMC, GSA and VTG sentences, instead of one per GGA')
+        parser.add_argument('--status', action='store_true',
+            help='show a status display of the latest fix, redrawn a few times a second, instead of printing every fix')
+        parser.add_argument('--status-rate', type=float, default=2.0, metavar='HZ',
+            help='status display redraws per second (default 2)')
+        parser.add_argument('--flush-rows', type=int, default=50,
+            help='write the csv file every this many rows (default 50)')
+        parser.add_argument('--flush-ms', type=float, default=1000,
+            help='or when this many milliseconds have passed since the last write (default 1000)')
+        parser.add_argument('--fsync', default='never',
+            choices=libnmea_navsat_driver.logwriter.FSYNC_POLICIES,
+            help='when to force the csv file onto the disk/SD card (default never, i.e. left to the OS)')
+        parser.add_argument('--binary', action='store_true',
+            help='also write a binary log (.bin) next to the csv file')
+        parser.add_argument('--rotate-mb', type=float, default=0,
+            help='start a new log file every this many megabytes')
+        parser.add_argument('--rotate-minutes', type=float, default=0,
+            help='start a new log file every this many minutes')
+        parser.add_argument('--compress', choices=sorted(libnmea_navsat_driver.logwriter.COMPRESSORS),
+            help='compress each finished log file in the background')
+        parser.add_argument('--capture', action='store_true',
+            help='also record the raw data from the port (.raw), for --replay')
+        parser.add_argument('--replay', metavar='FILE',
+            help='read a .raw capture instead of a serial port')
+        parser.add_argument('--replay-speed', type=float, default=0,
+            help='replay at this multiple of the recorded pace (default 0, as fast as possible)')
+        parser.add_argument('--latency', action='store_true',
+            help='measure the time from data arriving to usrfun returning and print a report at the end')
+        parser.add_argument('--latency-report', type=float, default=0, metavar='SECONDS',
+            help='with --latency or --profile, also print the report every this many seconds')
+        parser.add_argument('--profile', action='store_true',
+            help='count the time spent reading, parsing, in usrfun and writing, and print it at the end')
+        parser.add_argument('--profile-stats', metavar='FILE',
+            help='also run cProfile and save its stats to FILE (read them with python -m pstats FILE)')
+        args = parser.parse_args()
+        if not args.port and args.replay is None:
+            parser.error('a port or --replay FILE is required')
+        if args.latency and args.profile:
+            parser.error('use either --latency or --profile')
+        if (args.latency or args.profile) and (args.threaded or args.asyncio or len(args.port) > 1):
+            parser.error('--latency and --profile only work with a single port and without --threaded or --asyncio')
+        return args
+
+
+    def logfix(self, out, logs):
+
+        self.usrfun(*out)
+        if self.instrument is not None:
+            self.instrument.mark('usrfun')
+        self.writerow(out, logs)
+        if self.instrument is not None:
+            self.instrument.mark('write')
+        if self.handlers is not None:
+            self.handlers.dispatch(out)
+
+
+    def writerow(self, out, logs):
+
+        if not (isnan(out[3]) or isnan(out[4]) or isnan(out[5])):
+            for log in logs:
+                log.write(out)
+
+
+    def openlog(self, args, base, extension, header=libnmea_navsat_driver.logwriter.CSV_HEADER, time_column=0):
+
+        # a csv or binary log, split into segments with --rotate-mb/--rotate-minutes/--compress
+        if extension == ".csv":
+            open_segment = lambda path: libnmea_navsat_driver.logwriter.CSVLogWriter(path,
+                flush_rows=args.flush_rows, flush_interval=args.flush_ms/1000.0, fsync=args.fsync,
+                header=header)
+            index = base + "-index.csv"
         else:
-            serial_port = sys.argv[1]
+            from libnmea_navsat_driver.binlog import BinaryLogWriter
+            open_segment = BinaryLogWriter
+            index = base + "-bin-index.csv"
+        if not (args.rotate_mb or args.rotate_minutes or args.compress):
+            return open_segment(base + extension)
+        return libnmea_navsat_driver.logwriter.RotatingLogWriter(open_segment, base, extension, index,
+            max_bytes=args.rotate_mb*1e6 or None, max_seconds=args.rotate_minutes*60 or None,
+            compress=args.compress, time_column=time_column)
 
-        # set up port reading
-        GPS = serial.Serial(port=serial_port, baudrate=57600, timeout=2)
-        driver = libnmea_navsat_driver.driver.NMEADriver()
+
+    def startgpslog(self):
+
+        # parse arguments
+        args = self.parsearguments()
+        self.instrument = None
+        if len(args.port) > 1:
+            self.multigpslog(args)
+            return
 
         # set filename and open csv file
-        timestr = time.strftime("%Y%m%d-%H%M%S.csv")
-        csvfile = open(timestr, "w")
-        csvfile.write("time,fix,NumSat,latitude,longitude,altitude,speed,ground_course,covariance\n")
+        timestr = time.strftime("%Y%m%d-%H%M%S")
+        logs = [self.openlog(args, timestr, ".csv")]
+        if args.binary:
+            logs.append(self.openlog(args, timestr, ".bin"))
 
         # set time to zero
         t0 = time.time()
+        clock = lambda: time.time()-t0
+
+        # set up port reading
+        if args.replay:
+            # a replay gives the recorded timestamps, and never drops fixes (the queue
+            # policy is block below), so its fixes are the same every run
+            from libnmea_navsat_driver.capture import ReplayPort
+            GPS = ReplayPort(args.replay, speed=args.replay_speed)
+            clock = GPS.clock
+        else:
+            GPS = serial.Serial(port=args.port[0], baudrate=57600, timeout=2)
+            if args.capture:
+                from libnmea_navsat_driver.capture import CapturingPort
+                GPS = CapturingPort(GPS, timestr + ".raw", clock)
+                clock = GPS.clock
+        if args.latency:
+            from libnmea_navsat_driver.instrument import LatencyTracker
+            self.instrument = LatencyTracker()
+        elif args.profile:
+            from libnmea_navsat_driver.instrument import StageProfiler
+            self.instrument = StageProfiler()
+        driver = libnmea_navsat_driver.driver.NMEADriver(assemble_epochs=args.epochs)
+        decoder = libnmea_navsat_driver.framer.StreamDecoder(driver, instrument=self.instrument)
+        self.startdisplay(args, lambda: {'discarded bytes': decoder.framer.discarded})
+
+        # a replay waits for usrfun rather than dropping fixes, so it is repeatable
+        queue_policy = 'block' if args.replay else args.queue_policy
+        fixes = None
+        reader = None
+        profiler = None
+        if args.profile_stats:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        try:
+            if args.asyncio:
+                # reading, usrfun and csv writing are separate tasks on one event loop
+                import asyncio
+                from libnmea_navsat_driver.async_engine import AsyncGPSEngine
+                # a plain usrfun and the handlers run on threads of their own so they
+                # can't hold up reading; the log writes stay on the loop, with its flushes
+                engine = AsyncGPSEngine(GPS, decoder, self.usrfun, clock=clock,
+                    queue_size=args.queue_size, queue_policy=queue_policy,
+                    threaded_usrfun=True)
+                engine.add_sink(lambda out: self.writerow(out, logs), name='log')
+                if self.handlers is not None:
+                    engine.add_sink(self.handlers.dispatch, name='handlers', threaded=True)
+                engine.every(args.flush_ms/1000.0, lambda: [log.poll() for log in logs])
+                if args.heartbeat > 0:
+                    engine.every(args.heartbeat, lambda: print("%.1f s, %d NMEA and %d UBX frames" %
+                        (time.time()-t0, decoder.framer.nmea_frames, decoder.framer.ubx_frames)))
+                asyncio.run(engine.run())
+            elif args.threaded:
+                # the reader thread fills the queue, usrfun and logging run here
+                import queue
+                fixes = libnmea_navsat_driver.reader.FixQueue(args.queue_size, queue_policy)
+                reader = libnmea_navsat_driver.reader.SerialReader(GPS, decoder, fixes, clock=clock)
+                reader.start()
+                while True:
+                    try:
+                        out = fixes.get(timeout=0.5)
+                    except queue.Empty:
+                        if reader.error is not None:
+                            raise reader.error
+                    else:
+                        self.logfix(out, logs)
+                    # rows are also flushed every --flush-ms when no fixes come in
+                    for log in logs:
+                        log.poll()
+            elif self.instrument is not None:
+                # same as below, timing each fix from the arrival of its first byte
+                # (--latency) or the time spent in each stage (--profile)
+                next_report = time.monotonic() + args.latency_report
+                while True:
+                    data = GPS.read(GPS.in_waiting or 1)
+                    self.instrument.mark('read')
+                    for out, start in zip(decoder.feed(data, clock()), decoder.fix_starts):
+                        self.instrument.start = start
+                        self.logfix(out, logs)
+                    self.instrument.start = None
+                    for log in logs:
+                        log.poll()
+                    if args.latency_report > 0 and time.monotonic() >= next_report:
+                        print(self.instrument.report())
+                        next_report += args.latency_report
+            else:
+                while True:
+                    # read everything waiting (at least one byte, up to the timeout)
+                    data = GPS.read(GPS.in_waiting or 1)
+                    for out in decoder.feed(data, clock()):
+                        self.logfix(out, logs)
+                    # rows are also flushed every --flush-ms when no fixes come in
+                    for log in logs:
+                        log.poll()
+        except (KeyboardInterrupt, EOFError):
+            # stopped with Ctrl+C, or the end of a replay: with --epochs the last epoch
+            # is still open (the asyncio engine outputs it itself at the end of a replay)
+            if reader is not None:
+                reader.stop()
+                reader.join(timeout=3.0)
+            if not args.asyncio and not (reader is not None and reader.is_alive()):
+                for out in decoder.flush():
+                    self.logfix(out, logs)
+        finally:
+            # also on any other error, so the queued rows still reach the log
+            if reader is not None:
+                reader.stop()
+                reader.join(timeout=3.0)
+            self.stopdisplay()
+            GPS.close() #Close GPS serial port
+            for log in logs:
+                log.close() # Close CSV (and binary) file
+            if decoder.framer.discarded:
+                print("Discarded %d bytes of corrupted data" % decoder.framer.discarded)
+            if fixes is not None:
+                print("Fix queue: %(dropped)d dropped, max depth %(max_depth)d" % fixes.stats())
+            if self.instrument is not None:
+                print(self.instrument.report())
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(args.profile_stats)
+                print("cProfile stats saved to %s" % args.profile_stats)
+
+
+    def multigpslog(self, args):
+
+        # one csv file per port, plus all fixes merged in time order
+        timestr = time.strftime("%Y%m%d-%H%M%S")
+        t0 = time.time()
+        clock = lambda: time.time()-t0
+        names = [os.path.basename(port) for port in args.port]
+        ports = []
+        logs = []
+        for port, name in zip(args.port, names):
+            GPS = serial.Serial(port=port, baudrate=57600, timeout=0)
+            if args.capture:
+                from libnmea_navsat_driver.capture import CapturingPort
+                GPS = CapturingPort(GPS, timestr + "-" + name + ".raw", clock)
+            ports.append(GPS)
+            portlogs = [self.openlog(args, timestr + "-" + name, ".csv")]
+            if args.binary:
+                portlogs.append(self.openlog(args, timestr + "-" + name, ".bin"))
+            logs.append(portlogs)
+        merged = self.openlog(args, timestr + "-merged", ".csv",
+            header="port," + libnmea_navsat_driver.logwriter.CSV_HEADER, time_column=1)
+        from libnmea_navsat_driver.multiport import MultiPortReader
+        reader = MultiPortReader(ports, clock, assemble_epochs=args.epochs)
+        self.startdisplay(args, lambda: dict(("%s discarded bytes" % name, decoder.framer.discarded)
+            for name, decoder in zip(names, reader.decoders)))
+
+        def logportfix(index, out):
+            # usrfun can check self.port to see which GPS the fix is from
+            self.port = names[index]
+            self.logfix(out, logs[index])
+            if not (isnan(out[3]) or isnan(out[4]) or isnan(out[5])):
+                merged.write((names[index],) + tuple(out))
 
         try:
             while True:
-                data = GPS.readline().strip()
-                try:
-                    out = driver.add_sentence(data.decode(), time.time()-t0)
-                    if out != False:
-                        self.usrfun(*out)
-                        if not (isnan(out[3]) or isnan(out[4]) or isnan(out[5])):
-                            csvfile.write(str(out[0])+","+str(out[1])+","+str(out[2])+","+ \
-                                str(out[3])+","+str(out[4])+","+str(out[5])+","+ \
-                                str(out[6])+","+str(out[7])+","+str(out[8])+"\n")
-                except ValueError as e:
-                    warnings.warn("Value error, likely due to missing fields in the NMEA message. Error was: %s. Please report this issue at github.com/ros-drivers/nmea_navsat_driver, including a bag csvfile with the NMEA sentences that caused it." % e)
+                for index, out in reader.poll(timeout=0.5):
+                    logportfix(index, out)
+                for log in [merged] + [log for portlogs in logs for log in portlogs]:
+                    log.poll()
         except KeyboardInterrupt:
-            GPS.close() #Close GPS serial port
-            csvfile.close() # Close CSV file
+            # with --epochs the last epoch of each port is still open
+            for index, out in reader.flush():
+                logportfix(index, out)
+        finally:
+            self.stopdisplay()
+            reader.close()
+            for log in [merged] + [log for portlogs in logs for log in portlogs]:
+                log.close()
+            for name, decoder in zip(names, reader.decoders):
+                if decoder.framer.discarded:
+                    print("%s: discarded %d bytes of corrupted data" % (name, decoder.framer.discarded))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,194 @@
+import asyncio
+import inspect
+import time
+from concurrent.futures import ThreadPoolExecutor
+import logging
+logger = logging.getLogger('out')
+
+from libnmea_navsat_driver.reader import FixQueue
+
+
+def _put_drop_oldest(fixes, fix):
+    """put_nowait on an asyncio.Queue, dropping the oldest entry when full.
+    Returns True if something was dropped."""
+    dropped = False
+    if fixes.full():
+        fixes.get_nowait()
+        # it will never be consumed, so join() must not wait for it
+        fixes.task_done()
+        dropped = True
+    fixes.put_nowait(fix)
+    return dropped
+
+
+class AsyncGPSEngine(object):
+    """Acquisition on an asyncio event loop instead of a blocking read loop.
+
+    The serial port is put in non-blocking mode and its file descriptor is
+    registered with the event loop, so bytes are read as soon as they arrive
+    and decoded with a framer.StreamDecoder. Each fix goes to usrfun and to
+    every sink through its own queue and task. usrfun and sinks may be plain
+    functions or coroutine functions. A plain function runs on the event
+    loop and holds up reading for as long as it takes, unless it is added
+    with threaded=True: it then runs on a thread of its own, one fix at a
+    time. Other work such as a radio command channel or heartbeats can share
+    the loop via add_task and every.
+
+    queue_policy is one of reader.FixQueue.POLICIES and decides what happens
+    when a queue is full: 'drop-oldest' drops its oldest fix and 'latest'
+    keeps only the newest (both counted in dropped), 'block' stops reading
+    until there is room again, so no fix is ever lost.
+
+    Ports without a file descriptor to register (Windows, or a
+    capture.ReplayPort) are read with blocking reads on a thread of their
+    own instead. When the port raises EOFError, the end of a replay, run()
+    waits for the queued fixes to be consumed before raising it.
+    """
+
+    def __init__(self, port, decoder, usrfun, clock=time.time, queue_size=64,
+                 queue_policy='drop-oldest', threaded_usrfun=False):
+        if queue_policy not in FixQueue.POLICIES:
+            raise ValueError("Unknown queue policy %r, expected one of %s"
+                             % (queue_policy, ', '.join(FixQueue.POLICIES)))
+        self.port = port
+        self.decoder = decoder
+        self.clock = clock
+        self.queue_policy = queue_policy
+        self.queue_size = 1 if queue_policy == 'latest' else max(1, int(queue_size))
+        self.consumers = []  # (callback, name, unpack the fix, threaded)
+        self.dropped = {}
+        self.periodic = []
+        self.coroutines = []
+        self.tasks = []
+        # usrfun takes the fix fields as arguments, like in the other modes
+        self.add_sink(usrfun, name='usrfun', unpack=True, threaded=threaded_usrfun)
+
+    def add_sink(self, sink, name=None, unpack=False, threaded=False):
+        """Have sink(fix), or sink(*fix) with unpack, called for every fix on
+        its own task. With threaded, a plain function sink runs on its own
+        thread instead of the event loop."""
+        name = name or getattr(sink, '__name__', repr(sink))
+        self.consumers.append((sink, name, unpack, threaded))
+        self.dropped[name] = 0
+
+    def every(self, period, callback):
+        """Call callback() (function or coroutine function) every period
+        seconds while the engine runs"""
+        self.periodic.append((period, callback))
+
+    def add_task(self, coroutine):
+        """Run another coroutine alongside acquisition"""
+        self.coroutines.append(coroutine)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        queues = []
+        executors = []
+        for sink, name, unpack, threaded in self.consumers:
+            fixes = asyncio.Queue(self.queue_size)
+            queues.append((fixes, name))
+            executor = None
+            if threaded and not inspect.iscoroutinefunction(sink):
+                executor = ThreadPoolExecutor(1, thread_name_prefix=name)
+                executors.append(executor)
+            self.tasks.append(loop.create_task(
+                self.consume(sink, name, unpack, fixes, executor)))
+        for period, callback in self.periodic:
+            self.tasks.append(loop.create_task(self.repeat(period, callback)))
+        for coroutine in self.coroutines:
+            self.tasks.append(loop.create_task(coroutine))
+
+        timeout = self.port.timeout
+        fileno = getattr(self.port, 'fileno', None)
+        if fileno is not None:
+            self.port.timeout = 0
+        reader = None
+        try:
+            while True:
+                if fileno is not None:
+                    try:
+                        await self.readable(loop, fileno())
+                    except NotImplementedError:
+                        self.port.timeout = timeout
+                        fileno = None
+                        continue
+                    data = self.port.read(self.port.in_waiting or 1)
+                else:
+                    # Nothing to wait on (Windows, or a capture.ReplayPort),
+                    # so blocking reads are made on a thread instead
+                    if reader is None:
+                        reader = ThreadPoolExecutor(1, thread_name_prefix='port')
+                        executors.append(reader)
+                    data = await loop.run_in_executor(
+                        reader, self.port.read, self.port.in_waiting or 1)
+                if data:
+                    for fix in self.decoder.feed(data, self.clock()):
+                        await self.distribute(queues, fix)
+        except EOFError:
+            # The end of a replay: output the last epoch and let the
+            # consumers finish the queued fixes
+            for fix in self.decoder.flush():
+                await self.distribute(queues, fix)
+            for fixes, name in queues:
+                await fixes.join()
+            raise
+        finally:
+            for task in self.tasks:
+                task.cancel()
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+            self.tasks = []
+            for executor in executors:
+                executor.shutdown(wait=False)
+
+    async def readable(self, loop, fileno):
+        # add_reader is level triggered, so the port is only registered while
+        # waiting for it; with the block policy the consumers must be able to
+        # run while it is not being read
+        ready = loop.create_future()
+        loop.add_reader(fileno, lambda: ready.done() or ready.set_result(None))
+        try:
+            await ready
+        finally:
+            loop.remove_reader(fileno)
+
+    async def distribute(self, queues, fix):
+        if type(fix) is not tuple:
+            # A fixbuffer.FixView is only valid until its buffer wraps
+            fix = tuple(fix)
+        for fixes, name in queues:
+            if self.queue_policy == 'block':
+                await fixes.put(fix)
+            elif _put_drop_oldest(fixes, fix):
+                self.dropped[name] += 1
+
+    async def consume(self, sink, name, unpack, fixes, executor=None):
+        is_coroutine = inspect.iscoroutinefunction(sink)
+        loop = asyncio.get_running_loop()
+        while True:
+            fix = await fixes.get()
+            try:
+                if executor is not None:
+                    await loop.run_in_executor(
+                        executor, sink, *(fix if unpack else (fix,)))
+                else:
+                    result = sink(*fix) if unpack else sink(fix)
+                    if is_coroutine:
+                        await result
+            except Exception:
+                logger.exception("Error in %s", name)
+            finally:
+                fixes.task_done()
+
+    async def repeat(self, period, callback):
+        is_coroutine = inspect.iscoroutinefunction(callback)
+        next_time = time.monotonic()
+        while True:
+            next_time += period
+            await asyncio.sleep(max(0.0, next_time - time.monotonic()))
+            try:
+                if is_coroutine:
+                    await callback()
+                else:
+                    callback()
+            except Exception:
+                logger.exception("Error in periodic %r", callback)
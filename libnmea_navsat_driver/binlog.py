@@ -0,0 +1,211 @@
+import math
+import os
+import struct
+import sys
+import logging
+logger = logging.getLogger('out')
+
+from libnmea_navsat_driver.logwriter import CSV_HEADER, format_rows
+
+# File layout: a 16 byte header, then one 34 byte little-endian record per
+# fix, in the order of the NMEADriver.add_sentence tuple. Latitude and
+# longitude are stored as integer 1e-7 degrees (about 1 cm), NaN as
+# MISSING_DEGREES, and altitude, speed, course and covariance as float32.
+BINLOG_MAGIC = b'GPSFIX'
+BINLOG_VERSION = 2
+BINLOG_HEADER = struct.Struct('<6sHH6x')  # magic, version, record size
+BINLOG_RECORD = struct.Struct('<d?Bii4f')
+DEGREE_SCALE = 10000000
+MISSING_DEGREES = -2 ** 31
+
+RECORD_FIELDS = ('time', 'fix', 'NumSat', 'latitude', 'longitude', 'altitude',
+                 'speed', 'ground_course', 'covariance')
+_RECORD_FORMATS = ('<f8', '?', 'u1', '<i4', '<i4', '<f4', '<f4', '<f4', '<f4')
+
+
+def record_dtype():
+    """numpy dtype of one record as stored, with the field names of
+    fixbuffer.FIX_DTYPE"""
+    import numpy as np
+    return np.dtype({'names': RECORD_FIELDS, 'formats': _RECORD_FORMATS})
+
+
+def encode_degrees(value):
+    if math.isnan(value):
+        return MISSING_DEGREES
+    return int(round(value * DEGREE_SCALE))
+
+
+def pack_record(fix):
+    """Pack one fix tuple into a record"""
+    (time, fixed, NumSat, latitude, longitude,
+     altitude, speed, ground_course, covariance) = fix
+    return BINLOG_RECORD.pack(time, fixed, NumSat, encode_degrees(latitude),
+                              encode_degrees(longitude), altitude, speed,
+                              ground_course, covariance)
+
+
+def decode_records(records):
+    """Convert stored records to a fixbuffer.FIX_DTYPE array, with latitude
+    and longitude back in degrees"""
+    import numpy as np
+    from libnmea_navsat_driver.fixbuffer import FIX_DTYPE
+    fixes = np.empty(len(records), dtype=FIX_DTYPE)
+    for name in RECORD_FIELDS:
+        if name in ('latitude', 'longitude'):
+            degrees = records[name]
+            fixes[name] = np.where(degrees == MISSING_DEGREES, np.nan,
+                                   degrees / float(DEGREE_SCALE))
+        else:
+            fixes[name] = records[name]
+    return fixes
+
+
+def read_header(f):
+    """Check the header of an open binary log and return its version"""
+    data = f.read(BINLOG_HEADER.size)
+    if len(data) < BINLOG_HEADER.size:
+        raise ValueError("Not a binary GPS log, file too short")
+    magic, version, record_size = BINLOG_HEADER.unpack(data)
+    if magic != BINLOG_MAGIC:
+        raise ValueError("Not a binary GPS log, bad magic %r" % magic)
+    if version != BINLOG_VERSION or record_size != BINLOG_RECORD.size:
+        raise ValueError("Unsupported binary GPS log version %d (record size %d)"
+                         % (version, record_size))
+    return version
+
+
+class BinaryLogWriter(object):
+    """Append-only binary log of fixes.
+
+    With append, opening an existing log appends to it, after checking its
+    header and cutting off a record left incomplete by a crash, so the new
+    records stay aligned. Otherwise the file is overwritten. Same
+    write/write_block/poll/flush/close interface as logwriter.CSVLogWriter,
+    but the file is written through its own buffer.
+    """
+
+    def __init__(self, path, buffering=1 << 16, append=True):
+        self.path = path
+        self.rows_written = 0
+        if append and os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, 'r+b') as f:
+                read_header(f)
+                size = os.path.getsize(path)
+                whole = size - (size - BINLOG_HEADER.size) % BINLOG_RECORD.size
+                if whole != size:
+                    logger.warning("Dropping a partial record at the end of %s", path)
+                    f.truncate(whole)
+            self.file = open(path, 'ab', buffering=buffering)
+            self.bytes_written = whole
+        else:
+            self.file = open(path, 'wb', buffering=buffering)
+            self.file.write(BINLOG_HEADER.pack(BINLOG_MAGIC, BINLOG_VERSION,
+                                               BINLOG_RECORD.size))
+            self.bytes_written = BINLOG_HEADER.size
+
+    def write(self, fix):
+        self.file.write(pack_record(fix))
+        self.rows_written += 1
+        self.bytes_written += BINLOG_RECORD.size
+
+    def write_block(self, rows):
+        """Write many fixes at once (a list of tuples or a structured array)"""
+        if hasattr(rows, 'dtype'):
+            import numpy as np
+            records = np.empty(len(rows), dtype=record_dtype())
+            for name in RECORD_FIELDS:
+                if name in ('latitude', 'longitude'):
+                    degrees = rows[name]
+                    missing = np.isnan(degrees)
+                    records[name] = np.where(
+                        missing, MISSING_DEGREES,
+                        np.round(np.where(missing, 0, degrees) * DEGREE_SCALE))
+                else:
+                    records[name] = rows[name]
+            self.file.write(records.tobytes())
+        else:
+            self.file.write(b''.join([pack_record(fix) for fix in rows]))
+        self.rows_written += len(rows)
+        self.bytes_written += len(rows) * BINLOG_RECORD.size
+
+    def poll(self):
+        pass
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+def map_binary_log(path):
+    """Map the records of a binary log into a read-only numpy structured
+    array of record_dtype(), without reading them"""
+    import numpy as np
+    with open(path, 'rb') as f:
+        read_header(f)
+    count = (os.path.getsize(path) - BINLOG_HEADER.size) // BINLOG_RECORD.size
+    if count == 0:
+        return np.zeros(0, dtype=record_dtype())
+    return np.memmap(path, dtype=record_dtype(), mode='r',
+                     offset=BINLOG_HEADER.size, shape=(count,))
+
+
+def read_binary_log(path):
+    """Read a binary log into a numpy structured array of
+    fixbuffer.FIX_DTYPE"""
+    return decode_records(map_binary_log(path))
+
+
+def csv_to_binary(csv_path, binary_path):
+    """Convert a gpslog csv file to a binary log. Returns the number of
+    records."""
+    import numpy as np
+    from libnmea_navsat_driver.fixbuffer import FIX_DTYPE
+    with open(csv_path) as f:
+        f.readline()
+        rows = [line.split(',') for line in f if line.strip()]
+    records = np.empty(len(rows), dtype=FIX_DTYPE)
+    if rows:
+        columns = list(zip(*rows))
+        records['time'] = np.array(columns[0], dtype=float)
+        records['fix'] = np.array(columns[1]) == 'True'
+        records['NumSat'] = np.array(columns[2], dtype=int)
+        for i, name in enumerate(RECORD_FIELDS[3:], 3):
+            records[name] = np.array(columns[i], dtype=float)
+    writer = BinaryLogWriter(binary_path, append=False)
+    writer.write_block(records)
+    writer.close()
+    return len(records)
+
+
+def binary_to_csv(binary_path, csv_path, block=10000):
+    """Convert a binary log to a csv file in the gpslog layout. Returns the
+    number of rows."""
+    records = map_binary_log(binary_path)
+    with open(csv_path, 'w') as f:
+        f.write(CSV_HEADER)
+        for start in range(0, len(records), block):
+            fixes = decode_records(records[start:start + block])
+            columns = [fixes[name].tolist() for name in RECORD_FIELDS[:5]]
+            # The shortest text of the float32 values, e.g. 0.319 and not
+            # 0.3190000057220459
+            columns += [records[name][start:start + block].astype(str).tolist()
+                        for name in RECORD_FIELDS[5:]]
+            f.write(format_rows(list(zip(*columns))))
+    return len(records)
+
+
+if __name__ == '__main__':
+    # python -m libnmea_navsat_driver.binlog IN OUT, direction from IN's extension
+    if len(sys.argv) != 3:
+        print('Usage: python -m libnmea_navsat_driver.binlog input.csv output.bin')
+        print('       python -m libnmea_navsat_driver.binlog input.bin output.csv')
+        sys.exit(0)
+    if sys.argv[1].endswith('.csv'):
+        n = csv_to_binary(sys.argv[1], sys.argv[2])
+    else:
+        n = binary_to_csv(sys.argv[1], sys.argv[2])
+    print('Converted %d fixes' % n)
@@ -0,0 +1,148 @@
+import threading
+import time
+import logging
+logger = logging.getLogger('out')
+
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# How a handler is run:
+#   'inline'   in the calling thread, before dispatch() returns (keep it fast)
+#   'thread'   on a ThreadPoolExecutor worker
+#   'process'  on a ProcessPoolExecutor worker (handler and fix must pickle;
+#              for CPU-heavy analytics, which threads cannot run in parallel)
+HANDLER_MODES = ('inline', 'thread', 'process')
+
+
+def _timed_call(handler, fix):
+    # Runs in the worker, so the time does not include waiting in the pool
+    start = time.perf_counter()
+    handler(fix)
+    return time.perf_counter() - start
+
+
+class HandlerStats(object):
+    """Calls, time, budget overruns and skipped fixes of one handler"""
+
+    def __init__(self, name, mode, budget):
+        self.name = name
+        self.mode = mode
+        self.budget = budget
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.overruns = 0
+        self.last_report = None
+        self.errors = 0
+        self.skipped = 0
+        self.pending = 0
+
+
+class FixHandlers(object):
+    """Several handlers subscribed to the fixes, each with a time budget.
+
+    dispatch(fix) runs the inline handlers in registration order, then hands
+    the fix to the pooled ones and returns without waiting for them, so a
+    slow pooled handler never delays the code that dispatches. A pooled
+    handler with max_pending calls still unfinished skips the fix instead
+    of letting the pool's queue grow.
+
+    Every call is timed. A call longer than its handler's budget (seconds,
+    None for no budget) is an overrun. Overruns are counted in stats and
+    reported through on_overrun (by default a logged warning), at most once
+    per report_interval seconds per handler.
+    """
+
+    def __init__(self, max_workers=2, max_pending=4, report_interval=1.0):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.report_interval = report_interval
+        self.inline = []
+        self.pooled = []
+        self.stats = {}
+        self.executors = {}
+        self.lock = threading.Lock()  # pooled handlers finish on other threads
+
+    def register(self, handler, mode='inline', budget=None, name=None):
+        if mode not in HANDLER_MODES:
+            raise ValueError("Unknown handler mode %r, expected one of %s"
+                             % (mode, ', '.join(HANDLER_MODES)))
+        name = name or getattr(handler, '__name__', repr(handler))
+        if name in self.stats:
+            raise ValueError("A handler named %r is already registered" % name)
+        stats = HandlerStats(name, mode, budget)
+        self.stats[name] = stats
+        if mode == 'inline':
+            self.inline.append((handler, stats))
+        else:
+            if mode not in self.executors:
+                pool = ThreadPoolExecutor if mode == 'thread' else ProcessPoolExecutor
+                self.executors[mode] = pool(max_workers=self.max_workers)
+            self.pooled.append((handler, stats))
+        return handler
+
+    def dispatch(self, fix):
+        for handler, stats in self.inline:
+            start = time.perf_counter()
+            try:
+                handler(fix)
+            except Exception:
+                stats.errors += 1
+                logger.exception("Error in fix handler %s", stats.name)
+            self.record(stats, time.perf_counter() - start)
+        if self.pooled:
+            # A plain tuple, which pickles (a FixView does not)
+            fix = tuple(fix)
+            for handler, stats in self.pooled:
+                with self.lock:
+                    if stats.pending >= self.max_pending:
+                        stats.skipped += 1
+                        continue
+                    stats.pending += 1
+                future = self.executors[stats.mode].submit(_timed_call, handler, fix)
+                future.add_done_callback(
+                    lambda future, stats=stats: self.finished(stats, future))
+
+    def finished(self, stats, future):
+        with self.lock:
+            stats.pending -= 1
+        try:
+            elapsed = future.result()
+        except Exception:
+            stats.errors += 1
+            logger.exception("Error in fix handler %s", stats.name)
+            return
+        self.record(stats, elapsed)
+
+    def record(self, stats, elapsed):
+        with self.lock:
+            stats.calls += 1
+            stats.total += elapsed
+            stats.max = max(stats.max, elapsed)
+            report = False
+            if stats.budget is not None and elapsed > stats.budget:
+                stats.overruns += 1
+                now = time.monotonic()
+                if (stats.last_report is None or
+                        now - stats.last_report >= self.report_interval):
+                    stats.last_report = now
+                    report = True
+        if report:
+            self.on_overrun(stats, elapsed)
+
+    def on_overrun(self, stats, elapsed):
+        logger.warning("Fix handler %s took %.1f ms, over its %.1f ms budget "
+                       "(%d overruns so far)", stats.name, elapsed * 1e3,
+                       stats.budget * 1e3, stats.overruns)
+
+    def report(self):
+        lines = ["Handler         mode      calls   mean ms    max ms  overruns   skipped"]
+        for stats in self.stats.values():
+            lines.append("  %-14s%-8s%7d%10.2f%10.2f%10d%10d" % (
+                stats.name, stats.mode, stats.calls,
+                stats.total / stats.calls * 1e3 if stats.calls else 0.0,
+                stats.max * 1e3, stats.overruns, stats.skipped))
+        return "\n".join(lines)
+
+    def close(self, wait=True):
+        for executor in self.executors.values():
+            executor.shutdown(wait=wait)
@@ -0,0 +1,176 @@
+import struct
+import time
+import logging
+logger = logging.getLogger('out')
+
+# File layout: a 16 byte header, then one record per read from the port:
+# arrival time (f8), length (u4), and the bytes exactly as they were read
+CAPTURE_MAGIC = b'GPSRAW'
+CAPTURE_VERSION = 1
+CAPTURE_HEADER = struct.Struct('<6sH8x')  # magic, version
+CAPTURE_CHUNK = struct.Struct('<dI')  # arrival time, length
+
+
+class CaptureWriter(object):
+    """Writes raw port data with arrival timestamps to a capture file"""
+
+    def __init__(self, path, buffering=1 << 16):
+        self.path = path
+        self.file = open(path, 'wb', buffering=buffering)
+        self.file.write(CAPTURE_HEADER.pack(CAPTURE_MAGIC, CAPTURE_VERSION))
+        self.bytes_written = 0
+
+    def write(self, timestamp, data):
+        if data:
+            self.file.write(CAPTURE_CHUNK.pack(timestamp, len(data)))
+            self.file.write(data)
+            self.bytes_written += len(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+def iter_capture(path):
+    """Yield (timestamp, data) for each chunk of a capture file. A chunk cut
+    short at the end of the file (e.g. by a crash) is dropped."""
+    with open(path, 'rb') as f:
+        header = f.read(CAPTURE_HEADER.size)
+        if len(header) < CAPTURE_HEADER.size:
+            raise ValueError("Not a GPS capture file, file too short")
+        magic, version = CAPTURE_HEADER.unpack(header)
+        if magic != CAPTURE_MAGIC:
+            raise ValueError("Not a GPS capture file, bad magic %r" % magic)
+        if version != CAPTURE_VERSION:
+            raise ValueError("Unsupported GPS capture version %d" % version)
+        while True:
+            chunk = f.read(CAPTURE_CHUNK.size)
+            if len(chunk) < CAPTURE_CHUNK.size:
+                return
+            timestamp, length = CAPTURE_CHUNK.unpack(chunk)
+            data = f.read(length)
+            if len(data) < length:
+                logger.warning("Capture %s ends in a partial chunk", path)
+                return
+            yield timestamp, data
+
+
+class CapturingPort(object):
+    """Wraps a serial port and records everything read from it.
+
+    arrival_clock gives the arrival timestamps. clock() returns the arrival
+    time of the data read last; give that to the drivers, as with
+    ReplayPort, so a replay reproduces their timestamps exactly. Anything
+    other than read() is passed through to the port.
+    """
+
+    def __init__(self, port, path, arrival_clock=time.time):
+        self.port = port
+        self.capture = CaptureWriter(path)
+        self.arrival_clock = arrival_clock
+        self.last_timestamp = arrival_clock()
+
+    @property
+    def timeout(self):
+        return self.port.timeout
+
+    @timeout.setter
+    def timeout(self, timeout):
+        self.port.timeout = timeout
+
+    def read(self, size=1):
+        data = self.port.read(size)
+        self.last_timestamp = self.arrival_clock()
+        self.capture.write(self.last_timestamp, data)
+        return data
+
+    def clock(self):
+        return self.last_timestamp
+
+    def close(self):
+        self.capture.close()
+        self.port.close()
+
+    def __getattr__(self, name):
+        return getattr(self.port, name)
+
+
+class ReplayPort(object):
+    """Stands in for a serial port, playing back a capture file.
+
+    read() returns the recorded chunks in order. With speed > 0 a chunk is
+    not returned before its recorded time (divided by speed) has passed since
+    the first read, so speed=1 replays at the recorded pace; speed=0 replays
+    as fast as possible. clock() returns the arrival time of the chunk read
+    last, so giving it to the drivers in place of the wall clock makes a
+    replay give the same fixes, with the same timestamps, every time.
+
+    At the end of the capture read() raises EOFError. in_waiting is then 1
+    so that a loop reading only what is waiting gets to see it.
+    """
+
+    def __init__(self, path, speed=0.0):
+        self.path = path
+        self.speed = speed
+        self.chunks = iter_capture(path)
+        self.timestamp = 0.0
+        self.data = b''
+        self.offset = 0
+        self.finished = False
+        self.first_timestamp = None
+        self.start = None
+        self.timeout = None
+        self.advance()
+        self.last_timestamp = self.first_timestamp
+
+    def advance(self):
+        try:
+            self.timestamp, self.data = next(self.chunks)
+        except StopIteration:
+            self.data = b''
+            self.finished = True
+        self.offset = 0
+        if self.first_timestamp is None:
+            self.first_timestamp = self.timestamp
+
+    # Seconds until the next chunk is due
+    def delay(self):
+        if self.speed <= 0:
+            return 0.0
+        if self.start is None:
+            self.start = time.monotonic()
+        return ((self.timestamp - self.first_timestamp) / self.speed -
+                (time.monotonic() - self.start))
+
+    # Like a port, nothing is waiting until the next chunk is due
+    @property
+    def in_waiting(self):
+        if self.finished:
+            return 1
+        if self.offset == 0 and self.delay() > 0:
+            return 0
+        return len(self.data) - self.offset
+
+    def read(self, size=1):
+        if self.finished:
+            raise EOFError("End of capture %s" % self.path)
+        if self.offset == 0:
+            delay = self.delay()
+            if delay > 0:
+                time.sleep(delay)
+        data = self.data[self.offset:self.offset + size]
+        self.offset += len(data)
+        timestamp = self.timestamp
+        if self.offset >= len(self.data):
+            self.advance()
+        self.last_timestamp = timestamp
+        return data
+
+    def clock(self):
+        return self.last_timestamp
+
+    def close(self):
+        self.chunks.close()
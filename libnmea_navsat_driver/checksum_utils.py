@@ -46,3 +46,127 @@ def check_nmea_checksum(nmea_sentence):
         checksum ^= ord(c)
 
     return ("%02X" % checksum) == transmitted_checksum.upper()
+
+
+_HEX_DIGITS = frozenset(b'0123456789ABCDEF')
+
+
+_PADDING = b'\0' * 7
+
+
+# XOR of all bytes in data. Zero padded to a multiple of 8 and XORed as 64
+# bit words, then the 8 bytes of the result are folded together, so the loop
+# runs once per word instead of once per byte.
+def _xor_bytes(data):
+    data += _PADDING[:-len(data) % 8]
+    value = 0
+    for word in memoryview(data).cast('Q'):
+        value ^= word
+    value ^= value >> 32
+    value ^= value >> 16
+    value ^= value >> 8
+    return value & 0xFF
+
+
+# Same as check_nmea_checksum, for bytes, bytearray or memoryview input
+def check_nmea_checksum_bytes(nmea_sentence):
+    if type(nmea_sentence) is not bytes:
+        nmea_sentence = bytes(nmea_sentence)
+    star = nmea_sentence.find(b'*')
+    if star < 0 or nmea_sentence.find(b'*', star + 1) >= 0:
+        #No checksum bytes were found (or too many)
+        return False
+    transmitted_checksum = nmea_sentence[star + 1:].strip()
+
+    #Skip the $ at the front
+    checksum = _xor_bytes(nmea_sentence[1:star])
+    return (b"%02X" % checksum) == transmitted_checksum.upper()
+
+
+# Check the checksums of many NMEA sentences at once. sentences is a list of
+# lines (str or bytes) or a single bytes buffer of newline separated
+# sentences. Returns a NumPy bool array with one entry per sentence, the same
+# as calling check_nmea_checksum on each one. The XOR runs over a uint8 view
+# of all payloads joined together.
+def check_nmea_checksum_batch(sentences):
+    import numpy as np
+
+    if isinstance(sentences, (bytes, bytearray, memoryview)):
+        sentences = bytes(sentences).splitlines()
+
+    payloads = []
+    transmitted = []
+    rows = []
+    for row, nmea_sentence in enumerate(sentences):
+        if isinstance(nmea_sentence, str):
+            nmea_sentence = nmea_sentence.encode('ascii', 'replace')
+        split_sentence = bytes(nmea_sentence).split(b'*')
+        if len(split_sentence) != 2:
+            continue
+        transmitted_checksum = split_sentence[1].strip().upper()
+        if (len(transmitted_checksum) != 2 or
+                transmitted_checksum[0] not in _HEX_DIGITS or
+                transmitted_checksum[1] not in _HEX_DIGITS):
+            continue
+        payloads.append(split_sentence[0][1:])
+        transmitted.append(int(transmitted_checksum, 16))
+        rows.append(row)
+
+    valid = np.zeros(len(sentences), dtype=bool)
+    if not payloads:
+        return valid
+
+    data = np.frombuffer(b''.join(payloads), dtype=np.uint8)
+    lengths = np.array([len(payload) for payload in payloads])
+    starts = np.cumsum(lengths) - lengths
+    checksums = np.zeros(len(payloads), dtype=np.uint8)
+    # reduceat needs increasing start offsets, so empty payloads (checksum 0)
+    # are left out
+    nonempty = lengths > 0
+    if nonempty.any():
+        checksums[nonempty] = np.bitwise_xor.reduceat(data, starts[nonempty])
+    valid[rows] = checksums == np.array(transmitted, dtype=np.uint8)
+    return valid
+
+
+class NMEAChecksum(object):
+    """Checksum of one NMEA sentence, computed while its bytes arrive.
+
+    Feed the sentence in pieces of any size with update() (e.g. straight from
+    the serial port), then valid() gives the same answer as
+    check_nmea_checksum on the complete sentence. Call reset() before the
+    next sentence. framer.StreamFramer feeds one with each read, so a
+    sentence is checked as it is scanned.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.checksum = 0
+        self.started = False
+        self.stars = 0
+        self.tail = b''
+
+    def update(self, data):
+        if type(data) is not bytes:
+            data = bytes(data)
+        if not self.started and data:
+            #Skip the $ at the front
+            data = data[1:]
+            self.started = True
+        if self.stars == 0:
+            star = data.find(b'*')
+            if star < 0:
+                self.checksum ^= _xor_bytes(data)
+                return
+            self.checksum ^= _xor_bytes(data[:star])
+            self.stars = 1
+            data = data[star + 1:]
+        self.stars += data.count(b'*')
+        self.tail += data
+
+    def valid(self):
+        if self.stars != 1:
+            return False
+        return (b"%02X" % self.checksum) == self.tail.strip().upper()
@@ -35,18 +35,54 @@ import warnings
 import logging
 logger = logging.getLogger('out')
 
-from libnmea_navsat_driver.checksum_utils import check_nmea_checksum
+from libnmea_navsat_driver.checksum_utils import check_nmea_checksum, \
+    check_nmea_checksum_bytes
 import libnmea_navsat_driver.parser
+from libnmea_navsat_driver.parser import UTCClock
+from libnmea_navsat_driver.epoch import EpochAssembler
 
 class NMEADriver(object):
-    def __init__(self):
+    # fix_buffer: optional fixbuffer.FixRingBuffer. If given, each fix is
+    # written into it and add_sentence returns a FixView instead of a tuple.
+    # assemble_epochs: output one fix per navigation epoch, merged from
+    # GGA/RMC/GSA/VTG by epoch.EpochAssembler, instead of one per GGA.
+    # instrument: optional instrument.LatencyTracker or StageProfiler,
+    # marked when the checksum and parse of each sentence are done.
+    def __init__(self, fix_buffer=None, assemble_epochs=False, instrument=None):
         self.use_RMC = False
         self.speed = 0.0
         self.ground_course = 0.0
+        self.fix_buffer = fix_buffer
+        self.assembler = EpochAssembler() if assemble_epochs else None
+        self.instrument = instrument
+        # Date and day rollovers of this receiver's utc_time fields
+        self.clock = UTCClock()
+
+    def output(self, time, fix, NumSat, latitude, longitude, altitude, speed,
+               ground_course, covariance):
+        if self.fix_buffer is None:
+            return (time, fix, NumSat, latitude, longitude, altitude, speed,
+                    ground_course, covariance)
+        # Written into the buffer field by field, no tuple in between
+        return self.fix_buffer.view(self.fix_buffer.append(
+            time, fix, NumSat, latitude, longitude, altitude, speed,
+            ground_course, covariance))
+
+    # With assemble_epochs, the fix of the epoch still in progress (call it
+    # when the data ends), otherwise or if there is none False
+    def flush(self):
+        if self.assembler is None:
+            return False
+        fix = self.assembler.flush()
+        if not fix or self.fix_buffer is None:
+            return fix
+        return self.output(*fix)
 
     # Returns True if we successfully did something with the passed in
-    # nmea_string
-    def add_sentence(self, nmea_string, timestamp):
+    # nmea_string. nmea_string may be a str or bytes-like (bytes, bytearray,
+    # memoryview). valid is the result of a checksum check already done by
+    # the caller (e.g. framer.StreamFramer), None to check it here.
+    def add_sentence(self, nmea_string, timestamp, valid=None):
 
         time = 0.0
         fix = False
@@ -58,16 +94,39 @@ class NMEADriver(object):
         ground_course = 0.0
         covariance = 0.0
 
-        if not check_nmea_checksum(nmea_string):
+        # Raw bytes from the serial port take the bytes-native parser; str
+        # input still goes through the original regex parser
+        if isinstance(nmea_string, str):
+            if valid is None:
+                valid = check_nmea_checksum(nmea_string)
+            parse = libnmea_navsat_driver.parser.parse_nmea_sentence
+        else:
+            if valid is None:
+                valid = check_nmea_checksum_bytes(nmea_string)
+            parse = libnmea_navsat_driver.parser.parse_nmea_bytes
+        if self.instrument is not None:
+            self.instrument.mark('checksum')
+
+        if not valid:
             logger.debug("Received a sentence with an invalid checksum. " +
                           "Sentence was: %s" % repr(nmea_string))
             return False
 
-        parsed_sentence = libnmea_navsat_driver.parser.parse_nmea_sentence(nmea_string)
+        parsed_sentence = parse(nmea_string, self.clock)
+        if self.instrument is not None:
+            self.instrument.mark('parse')
         if not parsed_sentence:
             logger.debug("Failed to parse NMEA sentence. Sentece was: %s" % nmea_string)
             return False
 
+        if self.assembler is not None:
+            fix = self.assembler.add(parsed_sentence, timestamp)
+            if not fix:
+                return False
+            if self.fix_buffer is None:
+                return fix
+            return self.output(*fix)
+
         if 'RMC' in parsed_sentence:
             data = parsed_sentence['RMC']
             if data['fix_valid']:
@@ -107,7 +166,7 @@ class NMEADriver(object):
             speed = self.speed
             ground_course = self.ground_course
 
-            return (time, fix, NumSat, latitude, longitude,
+            return self.output(time, fix, NumSat, latitude, longitude,
                 altitude, speed, ground_course, covariance)
 
         elif 'RMC' in parsed_sentence:
@@ -140,7 +199,7 @@ class NMEADriver(object):
                     else:
                         ground_course = self.ground_course
 
-                return (time, fix, NumSat, latitude, longitude,
+                return self.output(time, fix, NumSat, latitude, longitude,
                     altitude, speed, ground_course, covariance)
             return False
 
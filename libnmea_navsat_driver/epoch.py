@@ -0,0 +1,155 @@
+import math
+import logging
+logger = logging.getLogger('out')
+
+
+# Sentence types merged into a fix. Anything else is ignored.
+EPOCH_SENTENCES = ('GGA', 'RMC', 'GSA', 'VTG')
+
+
+def signed_latitude(data):
+    if data['latitude_direction'] == 'S':
+        return -data['latitude']
+    return data['latitude']
+
+
+def signed_longitude(data):
+    if data['longitude_direction'] == 'W':
+        return -data['longitude']
+    return data['longitude']
+
+
+class EpochAssembler(object):
+    """Merges the GGA, RMC, GSA and VTG sentences of one navigation epoch into
+    a single fix, in the same tuple format as NMEADriver.add_sentence.
+
+    Sentences are grouped by their UTC time of day. GSA and VTG have none and
+    go into the epoch in progress. An epoch is closed when a sentence with a
+    new time arrives, or as soon as it holds every sentence type of the last
+    epoch closed that way, so a receiver with a steady sentence mix gets its
+    fix without waiting for the next epoch. After that, sentences with the
+    same time or an already seen type (e.g. $GN/$GP duplicates) are dropped,
+    and so are untimed sentences until the next epoch's first timed one, so
+    each epoch gives at most one fix. The last epoch has no next one to
+    close it; flush() outputs it at the end of the data.
+    """
+
+    def __init__(self):
+        self.utc_time = None
+        self.timestamp = None
+        self.sentences = {}
+        self.expected = None
+        self.closed_time = None
+        self.ground_course = 0.0
+
+    # Add one parsed sentence (from parse_nmea_sentence/parse_nmea_bytes).
+    # Returns the fix of an epoch that was closed by it, otherwise False.
+    def add(self, parsed_sentence, timestamp):
+        sentence_type, data = next(iter(parsed_sentence.items()))
+        if sentence_type not in EPOCH_SENTENCES:
+            return False
+
+        fix = False
+        utc_time = data['utc_time'] if 'utc_time' in data else None
+        if utc_time is not None and not math.isnan(utc_time):
+            # Compare the time of day only: the date of a sentence can change
+            # while the first RMC date arrives
+            utc_time %= 86400
+            if utc_time == self.closed_time:
+                # Rest of an epoch that was already output
+                return False
+            if self.utc_time is None:
+                self.utc_time = utc_time
+            elif utc_time != self.utc_time:
+                # Learn the sentence mix from the epoch that just ended
+                self.expected = frozenset(self.sentences)
+                fix = self.close()
+                self.utc_time = utc_time
+        elif self.utc_time is None and self.closed_time is not None:
+            # An epoch was closed as soon as it was complete and the next one
+            # has not started yet: an untimed sentence here is the rest of the
+            # closed epoch (e.g. the second GNGSA of a multi-constellation
+            # receiver), not the start of the next one
+            logger.debug("Dropping %s sentence of the closed epoch %r",
+                         sentence_type, self.closed_time)
+            return False
+
+        if sentence_type in self.sentences:
+            logger.debug("Dropping duplicate %s sentence in epoch %r",
+                         sentence_type, self.utc_time)
+            return fix
+        if not self.sentences:
+            self.timestamp = timestamp
+        self.sentences[sentence_type] = data
+
+        if (self.utc_time is not None and self.expected is not None and
+                self.expected.issubset(self.sentences)):
+            # If the previous epoch was only just closed above, this one is
+            # newer, so it wins. That only happens while the sentence mix is
+            # first being learned.
+            fix = self.close()
+        return fix
+
+    # Output the epoch in progress, e.g. at the end of a replay. Returns its
+    # fix, or False if there is none.
+    def flush(self):
+        if not self.sentences:
+            return False
+        return self.close()
+
+    # Close the epoch in progress and return its fix, or False if it has no
+    # position (GGA or RMC)
+    def close(self):
+        sentences = self.sentences
+        timestamp = self.timestamp
+        self.closed_time = self.utc_time
+        self.utc_time = None
+        self.sentences = {}
+        if 'GGA' not in sentences and 'RMC' not in sentences:
+            return False
+        return self.merge(sentences, timestamp)
+
+    def merge(self, sentences, timestamp):
+        fix = False
+        NumSat = 0
+        altitude = float('NaN')
+        speed = float('NaN')
+        ground_course = float('NaN')
+        covariance = float('NaN')
+
+        if 'GGA' in sentences:
+            data = sentences['GGA']
+            fix = data['fix_type'] > 0
+            NumSat = data['num_satellites']
+            latitude = signed_latitude(data)
+            longitude = signed_longitude(data)
+            # Altitude is above ellipsoid, so adjust for mean-sea-level
+            altitude = data['altitude'] + data['mean_sea_level']
+            covariance = data['hdop'] ** 2
+        else:
+            data = sentences['RMC']
+            fix = data['fix_valid']
+            latitude = signed_latitude(data)
+            longitude = signed_longitude(data)
+
+        if 'RMC' in sentences and sentences['RMC']['fix_valid']:
+            speed = sentences['RMC']['speed']
+            ground_course = sentences['RMC']['true_course']
+        elif 'VTG' in sentences:
+            speed = sentences['VTG']['speed']
+            ground_course = sentences['VTG']['true_course']
+
+        if 'GSA' in sentences:
+            data = sentences['GSA']
+            if math.isnan(covariance):
+                covariance = data['hdop'] ** 2
+            fix = fix and data['fix_mode'] >= 2
+
+        # The course is empty while stationary, keep the last one
+        if math.isnan(ground_course):
+            ground_course = self.ground_course
+        else:
+            self.ground_course = ground_course
+
+        return (timestamp, fix, NumSat, latitude, longitude,
+                altitude, speed, ground_course, covariance)
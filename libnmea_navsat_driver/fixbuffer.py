@@ -0,0 +1,141 @@
+import numpy as np
+
+# One record per fix, in the same order as the tuple from
+# NMEADriver.add_sentence
+FIX_DTYPE = np.dtype([
+    ('time', np.float64),
+    ('fix', np.bool_),
+    ('NumSat', np.int32),
+    ('latitude', np.float64),
+    ('longitude', np.float64),
+    ('altitude', np.float64),
+    ('speed', np.float64),
+    ('ground_course', np.float64),
+    ('covariance', np.float64),
+    ])
+
+
+class FixRingBuffer(object):
+    """Preallocated store for the last `capacity` fixes.
+
+    Pass one to NMEADriver to have add_sentence write each fix here instead
+    of returning a new tuple. Once full, the oldest fix is overwritten.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self.data = np.zeros(self.capacity, dtype=FIX_DTYPE)
+        # One array per field, viewing data, so a fix is written and read a
+        # field at a time without building a tuple
+        self.columns = [self.data[name] for name in FIX_DTYPE.names]
+        self.count = 0  # fixes appended so far
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, time, fix, NumSat, latitude, longitude, altitude, speed,
+               ground_course, covariance):
+        """Store a fix and return its index in data"""
+        index = self.count % self.capacity
+        columns = self.columns
+        columns[0][index] = time
+        columns[1][index] = fix
+        columns[2][index] = NumSat
+        columns[3][index] = latitude
+        columns[4][index] = longitude
+        columns[5][index] = altitude
+        columns[6][index] = speed
+        columns[7][index] = ground_course
+        columns[8][index] = covariance
+        self.count += 1
+        return index
+
+    def view(self, index):
+        """FixView of the fix last stored at index"""
+        newest = self.count - 1
+        return FixView(self, index, newest - (newest - index) % self.capacity)
+
+    def latest(self):
+        if not self.count:
+            return None
+        return FixView(self, (self.count - 1) % self.capacity, self.count - 1)
+
+    def segments(self, n=None):
+        """The last n fixes (all stored fixes if n is None), oldest first, as
+        at most two views into data. Nothing is copied."""
+        n = len(self) if n is None else min(n, len(self))
+        end = self.count % self.capacity or (self.capacity if self.count else 0)
+        start = end - n
+        if start >= 0:
+            return (self.data[start:end],)
+        return (self.data[start:], self.data[:end])
+
+    def last(self, n=None, out=None):
+        """The last n fixes, oldest first, as one contiguous array. Copies
+        into out (a FIX_DTYPE array of at least n entries) if given, so
+        repeated queries do not allocate."""
+        segments = self.segments(n)
+        if out is None:
+            if len(segments) == 1:
+                return segments[0].copy()
+            return np.concatenate(segments)
+        start = 0
+        for segment in segments:
+            out[start:start + len(segment)] = segment
+            start += len(segment)
+        return out[:start]
+
+
+class FixView(object):
+    """One fix in a FixRingBuffer. Unpacks and indexes like the tuple from
+    NMEADriver.add_sentence, and has the FIX_DTYPE names as attributes.
+    Fields are read straight from the buffer as Python numbers.
+
+    A view only refers to its slot in the buffer. Once capacity more fixes
+    have been appended the slot holds another fix, and reading the view
+    raises IndexError. Anything that keeps fixes for later (queues, logs)
+    must keep copy(), a plain tuple, instead.
+    """
+
+    __slots__ = ('buffer', 'index', 'sequence')
+
+    def __init__(self, buffer, index, sequence):
+        self.buffer = buffer
+        self.index = index
+        self.sequence = sequence  # number of the fix, counting from 0
+
+    def slot(self):
+        if self.buffer.count - self.sequence > self.buffer.capacity:
+            raise IndexError("Fix %d was overwritten in the FixRingBuffer"
+                             % self.sequence)
+        return self.index
+
+    def __len__(self):
+        return len(FIX_DTYPE.names)
+
+    def __iter__(self):
+        index = self.slot()
+        for column in self.buffer.columns:
+            yield column.item(index)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return self.copy()[item]
+        return self.buffer.columns[item].item(self.slot())
+
+    def copy(self):
+        """The fix as a tuple, which stays valid after the buffer wraps"""
+        index = self.slot()
+        return tuple(column.item(index) for column in self.buffer.columns)
+
+    def __repr__(self):
+        return 'FixView%r' % (self.copy(),)
+
+
+def _field_property(position):
+    def getter(self):
+        return self.buffer.columns[position].item(self.slot())
+    return property(getter)
+
+for _position, _name in enumerate(FIX_DTYPE.names):
+    setattr(FixView, _name, _field_property(_position))
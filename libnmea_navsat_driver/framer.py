@@ -0,0 +1,210 @@
+import warnings
+import logging
+logger = logging.getLogger('out')
+
+from libnmea_navsat_driver.ubx import UBX_SYNC, UBX_HEADER, ubx_checksum, \
+    ubx_header_plausible, UBXDriver
+from libnmea_navsat_driver.driver import NMEADriver
+from libnmea_navsat_driver.checksum_utils import check_nmea_checksum_bytes, \
+    NMEAChecksum
+
+# NMEA allows 82 characters per sentence; leave room for receivers that
+# send longer proprietary ones
+NMEA_MAX_LENGTH = 128
+_HEX_DIGITS = frozenset(b'0123456789ABCDEFabcdef')
+
+
+class StreamFramer(object):
+    """Cuts a serial byte stream into NMEA sentences and UBX messages.
+
+    feed() takes whatever was read from the port, in chunks of any size, and
+    returns the complete frames found so far: NMEA sentences as bytes from
+    '$' to the checksum (no line ending, like readline().strip()) and UBX
+    messages as bytes from the sync characters to the checksum. An NMEA
+    frame must end in *HH before the line ending and both kinds must pass
+    their checksum. The NMEA checksum is computed with an NMEAChecksum as
+    the bytes are scanned, including those of a sentence still waiting for
+    the rest of it. On anything else the framer skips forward to the next
+    '$' or UBX sync, so a corrupted or merged line only loses itself, not
+    the frames after it. Skipped bytes are counted in discarded.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.discarded = 0
+        self.nmea_frames = 0
+        self.ubx_frames = 0
+        self.checksum = NMEAChecksum()
+        # bytes of the sentence at the start of buffer already checksummed
+        self.checked = 0
+
+    def feed(self, data):
+        self.buffer += data
+        buffer = self.buffer
+        frames = []
+        start = 0
+        while True:
+            # Next possible frame start
+            nmea = buffer.find(b'$', start)
+            ubx = buffer.find(UBX_SYNC, start)
+            if nmea < 0 and ubx < 0:
+                # Keep a trailing 0xB5, it may be the start of a UBX sync
+                end = len(buffer) - 1 if buffer[-1:] == UBX_SYNC[:1] else len(buffer)
+                self.discarded += end - start
+                start = end
+                break
+            pos = ubx if nmea < 0 or 0 <= ubx < nmea else nmea
+            self.discarded += pos - start
+            start = pos
+
+            if pos == nmea:
+                end = self.frame_nmea(buffer, pos)
+                end = self.check_nmea(buffer, pos, end)
+            else:
+                end = self.frame_ubx(buffer, pos)
+            if end is None:
+                # Incomplete, wait for more data
+                break
+            if end < 0:
+                # Not a frame, skip the first byte and look again
+                self.discarded += 1
+                start += 1
+                continue
+            if pos == nmea:
+                frames.append(bytes(buffer[pos:end]).rstrip())
+                self.nmea_frames += 1
+                start = buffer.find(b'\n', end) + 1
+            else:
+                frames.append(bytes(buffer[pos:end]))
+                self.ubx_frames += 1
+                start = end
+        del buffer[:start]
+        return frames
+
+    # These return the end of the frame starting at pos, None if more data is
+    # needed, or -1 if there is no valid frame at pos.
+
+    def check_nmea(self, buffer, pos, end):
+        # Only a sentence left at the start of the buffer by the last feed
+        # has been partly checksummed
+        checked = self.checked if pos == 0 else 0
+        if checked == 0:
+            self.checksum.reset()
+        if end is None:
+            self.checksum.update(buffer[pos + checked:])
+            self.checked = len(buffer) - pos
+            return None
+        self.checked = 0
+        if end < 0:
+            return end
+        self.checksum.update(buffer[pos + checked:end])
+        return end if self.checksum.valid() else -1
+
+    def frame_nmea(self, buffer, pos):
+        newline = buffer.find(b'\n', pos, pos + NMEA_MAX_LENGTH)
+        if newline < 0:
+            if len(buffer) - pos < NMEA_MAX_LENGTH:
+                return None
+            return -1
+        end = newline
+        while end > pos and buffer[end - 1] in b'\r ':
+            end -= 1
+        # A second '$' means two sentences were merged by a lost line ending
+        if (end - pos < 4 or buffer.find(b'$', pos + 1, end) >= 0 or
+                buffer[end - 3] != 0x2A or buffer[end - 2] not in _HEX_DIGITS or
+                buffer[end - 1] not in _HEX_DIGITS):
+            return -1
+        return end
+
+    def frame_ubx(self, buffer, pos):
+        if len(buffer) - pos < UBX_HEADER.size:
+            return None
+        _, msg_class, msg_id, length = UBX_HEADER.unpack_from(buffer, pos)
+        # A B5 62 in line noise must not hold up the NMEA frames after it
+        # while the framer waits for a frame that never comes
+        if not ubx_header_plausible(msg_class, msg_id, length):
+            return -1
+        end = pos + UBX_HEADER.size + length + 2
+        if len(buffer) < end:
+            if self.nmea_follows(buffer, pos + UBX_HEADER.size):
+                return -1
+            return None
+        if ubx_checksum(memoryview(buffer)[pos + 2:end - 2]) != \
+                (buffer[end - 2], buffer[end - 1]):
+            return -1
+        return end
+
+    def nmea_follows(self, buffer, pos):
+        # True if a complete NMEA sentence with a good checksum starts at or
+        # after pos, which is not going to happen inside a real UBX payload
+        dollar = buffer.find(b'$', pos)
+        while dollar >= 0:
+            end = self.frame_nmea(buffer, dollar)
+            if end is not None and end > 0 and \
+                    check_nmea_checksum_bytes(buffer[dollar:end]):
+                return True
+            dollar = buffer.find(b'$', dollar + 1)
+        return False
+
+
+class StreamDecoder(object):
+    """A StreamFramer feeding an NMEADriver and a UBXDriver: raw bytes from
+    the port in, fixes out.
+
+    instrument may be an instrument.LatencyTracker or StageProfiler, marked
+    as each frame is decoded. For latency, feed() times each frame from the
+    arrival of its first byte (when the read that brought it returned) and
+    fix_starts holds that time for each fix it returned, for marking the
+    later stages.
+    """
+
+    def __init__(self, driver=None, ubx_driver=None, instrument=None):
+        self.framer = StreamFramer()
+        self.driver = driver if driver is not None else NMEADriver()
+        self.ubx_driver = ubx_driver if ubx_driver is not None else UBXDriver()
+        self.instrument = instrument
+        self.fix_starts = []
+        self.buffer_arrival = None
+        if instrument is not None:
+            self.driver.instrument = instrument
+
+    # The fixes still held by the drivers (the last epoch), when the data ends
+    def flush(self):
+        fix = self.driver.flush()
+        return [fix] if fix else []
+
+    # Returns the list of fixes from the frames completed by data
+    def feed(self, data, timestamp):
+        instrument = self.instrument
+        if instrument is not None:
+            arrival = instrument.clock()
+            # Only the first frame can start in data left over from earlier
+            # reads
+            start = (self.framer.buffer and self.buffer_arrival) or arrival
+            self.fix_starts = []
+        fixes = []
+        for frame in self.framer.feed(data):
+            if instrument is not None:
+                instrument.start = start
+                instrument.mark('frame')
+            try:
+                if frame[0] == 0x24:
+                    # the framer has checked the checksum
+                    out = self.driver.add_sentence(frame, timestamp, True)
+                else:
+                    out = self.ubx_driver.add_frame(frame, timestamp)
+            except ValueError as e:
+                warnings.warn("Value error, likely due to missing fields in the NMEA message. Error was: %s. Please report this issue at github.com/ros-drivers/nmea_navsat_driver, including a bag csvfile with the NMEA sentences that caused it." % e)
+                out = False
+            if instrument is not None:
+                instrument.mark('driver')
+                if out != False:
+                    instrument.mark('fix')
+                    self.fix_starts.append(start)
+                start = arrival
+            if out != False:
+                fixes.append(out)
+        if instrument is not None:
+            instrument.start = None
+            self.buffer_arrival = start if self.framer.buffer else None
+        return fixes
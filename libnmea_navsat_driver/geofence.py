@@ -0,0 +1,373 @@
+import math
+import logging
+logger = logging.getLogger('out')
+
+from libnmea_navsat_driver.projection import EARTH_RADIUS, LocalProjector
+
+
+class EllipseGeofence(object):
+    """The boundary ellipse of gpslogger.ellipse, compiled once.
+
+    With (x, y) the east/north offset from the center rotated by theta,
+    ell = (x/R[0])**2 + (y/R[1])**2 is a quadratic form in the offset. Its
+    three coefficients, with the projector's meters per degree folded in,
+    are computed here, so value() is a handful of multiplications on the
+    latitude and longitude differences. ell > 1 is outside.
+
+    The *_track methods take numpy arrays (e.g. the columns of a log file).
+    """
+
+    def __init__(self, center, R, theta, radius=EARTH_RADIUS):
+        self.center = list(center)
+        self.R = list(R)
+        self.theta = theta
+        self.projector = LocalProjector(center[0], center[1], radius)
+        ct = math.cos(theta)
+        st = math.sin(theta)
+        # ell = a*east**2 + 2*b*east*north + c*north**2
+        a = (ct/R[0])**2 + (st/R[1])**2
+        b = ct*st*(1.0/R[0]**2 - 1.0/R[1]**2)
+        c = (st/R[0])**2 + (ct/R[1])**2
+        ke = self.projector.east_per_deg
+        kn = self.projector.north_per_deg
+        # the same per degree of longitude (x) and latitude (y)
+        self.xx = a*ke*ke
+        self.xy = 2.0*b*ke*kn
+        self.yy = c*kn*kn
+        self.lat0 = center[0]
+        self.lon0 = center[1]
+
+    def value(self, lat, lon):
+        """ell for one point, same as gpslogger.ellipse([lat, lon])"""
+        x = lon - self.lon0
+        y = lat - self.lat0
+        return x*(self.xx*x + self.xy*y) + self.yy*y*y
+
+    def margin(self, lat, lon):
+        """Meters to the boundary along the line from the center, negative outside"""
+        r = self.projector.distance(lat, lon)[2]
+        ell = self.value(lat, lon)
+        if ell == 0.0:
+            return min(self.R)
+        s = math.sqrt(ell)
+        return r/s - r
+
+    def value_track(self, lat, lon):
+        """ell for arrays of points"""
+        import numpy as np
+        x = np.asarray(lon, dtype=float) - self.lon0
+        y = np.asarray(lat, dtype=float) - self.lat0
+        return x*(self.xx*x + self.xy*y) + self.yy*y*y
+
+    def margin_track(self, lat, lon, ell=None):
+        """margin() for arrays of points"""
+        import numpy as np
+        if ell is None:
+            ell = self.value_track(lat, lon)
+        r = self.projector.distance_batch(lat, lon)[2]
+        s = np.sqrt(ell)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            margin = r/s - r
+        return np.where(s > 0.0, margin, min(self.R))
+
+    def evaluate_track(self, time, lat, lon, limit=1.0):
+        """Check a whole track: (ell, margin, first_violation) where
+        first_violation is the first time with ell > limit, or None"""
+        import numpy as np
+        ell = self.value_track(lat, lon)
+        margin = self.margin_track(lat, lon, ell)
+        outside = np.flatnonzero(ell > limit)
+        first_violation = float(np.asarray(time)[outside[0]]) if len(outside) else None
+        return ell, margin, first_violation
+
+
+def _segment_distance_array(px, py, ax, ay, dx, dy, len2):
+    import numpy as np
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.where(len2 > 0.0, ((px - ax)*dx + (py - ay)*dy)/len2, 0.0)
+    t = np.clip(t, 0.0, 1.0)
+    return np.hypot(px - ax - t*dx, py - ay - t*dy)
+
+
+class PolygonGeofence(object):
+    """Keep-in and keep-out polygon zones, with a uniform grid index.
+
+    Zones are given as lists of [lat, lon] corners and kept as east/north
+    meters from a reference point (the first corner added, unless given). A
+    fix is allowed when it is inside at least one keep-in zone (if there are
+    any) and inside no keep-out zone.
+
+    The index is built on the first check (or by build()). It covers the
+    zones plus padding meters with square cells. For every cell it stores
+    which zones contain the cell's center, and the few edges that can be the
+    nearest edge to any point of the cell, or can lie between the center and
+    such a point. A check only looks at the edges of its own cell: the
+    containing zones are the center's, flipped for each edge crossed on the
+    way from the center to the fix. The cost per fix depends on how busy the
+    cell is, not on the number of zones. Fixes outside the grid are outside
+    every zone; their distance is found by going through all the edges.
+    """
+
+    def __init__(self, reference=None, cell_size=None, padding=50.0,
+                 radius=EARTH_RADIUS):
+        self.radius = radius
+        self.projector = None
+        if reference is not None:
+            self.projector = LocalProjector(reference[0], reference[1], radius)
+        self.requested_cell_size = cell_size
+        self.padding = padding
+        self.names = []
+        self.keep_out = []
+        self.polygons = []  # (east, north) corner lists
+        self.keep_in_mask = 0
+        self.keep_out_mask = 0
+        self.cells = None
+
+    def add_zone(self, points, keep_out=False, name=None):
+        """Add a polygon (a list of [lat, lon] corners), returns its index"""
+        points = [tuple(pt) for pt in points]
+        if len(points) > 1 and points[0] == points[-1]:
+            points = points[:-1]
+        if len(points) < 3:
+            raise ValueError("A zone needs at least 3 corners, got %d" % len(points))
+        if self.projector is None:
+            self.projector = LocalProjector(points[0][0], points[0][1], self.radius)
+        index = len(self.polygons)
+        self.polygons.append([self.projector.to_enu(lat, lon) for lat, lon in points])
+        self.names.append(name if name is not None else 'zone%d' % index)
+        self.keep_out.append(keep_out)
+        if keep_out:
+            self.keep_out_mask |= 1 << index
+        else:
+            self.keep_in_mask |= 1 << index
+        self.cells = None  # rebuilt on the next check
+        return index
+
+    def build(self):
+        import numpy as np
+        if not self.polygons:
+            raise ValueError("No zones to build an index for")
+
+        # edges as (east, north, d_east, d_north, length**2, zone bit, zone)
+        edges = []
+        for zone, corners in enumerate(self.polygons):
+            for i, (ax, ay) in enumerate(corners):
+                bx, by = corners[(i + 1) % len(corners)]
+                dx, dy = bx - ax, by - ay
+                edges.append((ax, ay, dx, dy, dx*dx + dy*dy, 1 << zone, zone))
+        self.edges = edges
+        ax, ay, dx, dy, len2 = (np.array([edge[k] for edge in edges]) for k in range(5))
+        self.edge_arrays = (ax, ay, dx, dy, len2)
+        self.edge_zones = np.array([edge[6] for edge in edges])
+
+        east = np.concatenate([ax, ax + dx])
+        north = np.concatenate([ay, ay + dy])
+        self.east0 = east.min() - self.padding
+        self.north0 = north.min() - self.padding
+        width = east.max() + self.padding - self.east0
+        height = north.max() + self.padding - self.north0
+        size = self.requested_cell_size
+        if size is None:
+            # about 4096 cells, but no smaller than a meter
+            size = max(1.0, math.sqrt(width*height/4096.0))
+        self.cell_size = size
+        self.nx = int(math.ceil(width/size))
+        self.ny = int(math.ceil(height/size))
+
+        ix, iy = np.meshgrid(np.arange(self.nx), np.arange(self.ny), indexing='ij')
+        cx = self.east0 + (ix.ravel() + 0.5)*size
+        cy = self.north0 + (iy.ravel() + 0.5)*size
+        half_diagonal = size*math.sqrt(0.5)
+
+        # zones containing each cell's center, as a bit mask
+        masks = np.zeros(len(cx), dtype=object)
+        masks[:] = 0
+        for zone in range(len(self.polygons)):
+            masks[self._contains(zone, cx, cy)] += 1 << zone
+
+        # Nearest-edge candidates. For a point p of the cell with center c,
+        # |dist(p, e) - dist(c, e)| <= half_diagonal, so the nearest edge to
+        # p is among those with dist(c, e) <= min_e dist(c, e) + 2*half_diagonal.
+        # This also includes every edge that crosses the cell.
+        self.cells = cells = []
+        self.cell_edges = []
+        chunk = max(1, (1 << 20)//len(edges))
+        for start in range(0, len(cx), chunk):
+            px = cx[start:start + chunk, None]
+            py = cy[start:start + chunk, None]
+            dist = _segment_distance_array(px, py, ax, ay, dx, dy, len2)
+            limit = dist.min(axis=1) + 2.0*half_diagonal
+            for row, row_limit, mask, x, y in zip(dist, limit, masks[start:start + chunk],
+                                                  cx[start:start + chunk], cy[start:start + chunk]):
+                # nearest to the center first, so locate() can stop early
+                candidates = np.flatnonzero(row <= row_limit)
+                candidates = candidates[np.argsort(row[candidates], kind='stable')]
+                self.cell_edges.append(candidates)
+                cells.append((float(x), float(y), int(mask),
+                              tuple((float(row[k]),) + edges[k] for k in candidates)))
+
+        # the same as arrays, for locate_track (candidates padded with -1)
+        self.cell_table = np.full((len(cells), max(len(c) for c in self.cell_edges)), -1, dtype=int)
+        for i, candidates in enumerate(self.cell_edges):
+            self.cell_table[i, :len(candidates)] = candidates
+        self.cell_inside = np.array([[mask >> zone & 1 for zone in range(len(self.polygons))]
+                                     for mask in masks], dtype=bool)
+        self.cell_centers = np.column_stack([cx, cy])
+        logger.debug("Geofence index: %d zones, %d edges, %d x %d cells of %.1f m",
+                     len(self.polygons), len(edges), self.nx, self.ny, size)
+
+    def _contains(self, zone, east, north):
+        # crossing number of a ray to +east, for arrays of points
+        import numpy as np
+        inside = np.zeros(np.shape(east), dtype=bool)
+        corners = self.polygons[zone]
+        for i, (ax, ay) in enumerate(corners):
+            bx, by = corners[(i + 1) % len(corners)]
+            if ay == by:
+                continue
+            crosses = (ay > north) != (by > north)
+            x = ax + (north - ay)*(bx - ax)/(by - ay)
+            inside ^= crosses & (east < x)
+        return inside
+
+    def locate(self, lat, lon):
+        """(zones, distance, zone) for one fix: a bit mask of the zones that
+        contain it (bit i for zone i), the distance in meters to the nearest
+        zone edge, and the index of the zone that edge belongs to"""
+        if self.cells is None:
+            self.build()
+        px, py = self.projector.to_enu(lat, lon)
+        ix = int((px - self.east0)//self.cell_size)
+        iy = int((py - self.north0)//self.cell_size)
+        if not (0 <= ix < self.nx and 0 <= iy < self.ny):
+            return self._locate_outside(px, py)
+        cx, cy, mask, edges = self.cells[ix*self.ny + iy]
+        ux, uy = px - cx, py - cy
+        r = math.hypot(ux, uy)
+        nearest = float('inf')
+        zone = -1
+        for center_distance, ax, ay, dx, dy, len2, bit, edge_zone in edges:
+            # the edge is at least center_distance - r from the fix
+            if center_distance - r > nearest:
+                break  # and so are the rest, none of which can be crossed
+            ex, ey = ax - cx, ay - cy
+            if center_distance <= r:
+                # flip the zone if the edge is crossed between the center and
+                # the fix (half-open side test, so a line through a corner
+                # counts once)
+                sa = ux*ey - uy*ex > 0.0
+                sb = ux*(ey + dy) - uy*(ex + dx) > 0.0
+                if sa != sb:
+                    s = (ex*dy - ey*dx)/(ux*dy - uy*dx)
+                    if 0.0 <= s < 1.0:
+                        mask ^= bit
+            vx, vy = ux - ex, uy - ey
+            t = (vx*dx + vy*dy)/len2 if len2 > 0.0 else 0.0
+            if t < 0.0:
+                t = 0.0
+            elif t > 1.0:
+                t = 1.0
+            d = math.hypot(vx - t*dx, vy - t*dy)
+            if d < nearest:
+                nearest = d
+                zone = edge_zone
+        return mask, nearest, zone
+
+    def _locate_outside(self, px, py):
+        dist = _segment_distance_array(px, py, *self.edge_arrays)
+        nearest = int(dist.argmin())
+        return 0, float(dist[nearest]), int(self.edge_zones[nearest])
+
+    def allowed(self, mask):
+        """True if a fix inside the zones of mask is allowed"""
+        if self.keep_in_mask and not mask & self.keep_in_mask:
+            return False
+        return not mask & self.keep_out_mask
+
+    def check(self, lat, lon):
+        """(ok, margin, name) for one fix: whether it is allowed, the distance
+        to the nearest zone edge (negative if not allowed) and that zone's name"""
+        mask, distance, zone = self.locate(lat, lon)
+        ok = self.allowed(mask)
+        return ok, distance if ok else -distance, self.names[zone]
+
+    def locate_track(self, lat, lon, chunk=1 << 16):
+        """locate() for arrays of points: (inside, distance, zone) with inside
+        a boolean array of shape (points, zones)"""
+        import numpy as np
+        if self.cells is None:
+            self.build()
+        east, north = self.projector.to_enu_batch(lat, lon)
+        east = east.ravel()
+        north = north.ravel()
+        n = len(east)
+        inside = np.zeros((n, len(self.polygons)), dtype=bool)
+        distance = np.empty(n)
+        zone = np.empty(n, dtype=int)
+
+        ax, ay, dx, dy, len2 = self.edge_arrays
+        ix = np.floor((east - self.east0)/self.cell_size).astype(int)
+        iy = np.floor((north - self.north0)/self.cell_size).astype(int)
+        in_grid = (ix >= 0) & (ix < self.nx) & (iy >= 0) & (iy < self.ny)
+        grid_points = np.flatnonzero(in_grid)
+        for start in range(0, len(grid_points), chunk):
+            points = grid_points[start:start + chunk]
+            cell = ix[points]*self.ny + iy[points]
+            candidates = self.cell_table[cell]
+            valid = candidates >= 0
+            k = np.where(valid, candidates, 0)
+            px = east[points, None]
+            py = north[points, None]
+            cx = self.cell_centers[cell, 0][:, None]
+            cy = self.cell_centers[cell, 1][:, None]
+            ux, uy = px - cx, py - cy
+            ex, ey = ax[k] - cx, ay[k] - cy
+            sa = ux*ey - uy*ex > 0.0
+            sb = ux*(ey + dy[k]) - uy*(ex + dx[k]) > 0.0
+            with np.errstate(divide='ignore', invalid='ignore'):
+                s = (ex*dy[k] - ey*dx[k])/(ux*dy[k] - uy*dx[k])
+            flips = valid & (sa != sb) & (s >= 0.0) & (s < 1.0)
+            zones = self.edge_zones[k]
+            chunk_inside = self.cell_inside[cell]
+            rows, columns = np.nonzero(flips)  # rare, so flip them one by one
+            flipped = np.zeros(chunk_inside.shape, dtype=int)
+            np.add.at(flipped, (rows, zones[rows, columns]), 1)
+            chunk_inside ^= flipped % 2 == 1
+            inside[points] = chunk_inside
+            dist = np.where(valid, _segment_distance_array(px, py, ax[k], ay[k],
+                                                           dx[k], dy[k], len2[k]), np.inf)
+            nearest = dist.argmin(axis=1)
+            distance[points] = dist[np.arange(len(points)), nearest]
+            zone[points] = zones[np.arange(len(points)), nearest]
+
+        # outside the grid, compare with every edge
+        outside_points = np.flatnonzero(~in_grid)
+        rows = max(1, chunk//len(self.edges))
+        for start in range(0, len(outside_points), rows):
+            points = outside_points[start:start + rows]
+            dist = _segment_distance_array(east[points, None], north[points, None],
+                                           ax, ay, dx, dy, len2)
+            nearest = dist.argmin(axis=1)
+            distance[points] = dist[np.arange(len(points)), nearest]
+            zone[points] = self.edge_zones[nearest]
+        return inside, distance, zone
+
+    def check_track(self, lat, lon):
+        """check() for arrays of points: (ok, margin, zone) arrays, zone being
+        the index of the zone with the nearest edge"""
+        import numpy as np
+        inside, distance, zone = self.locate_track(lat, lon)
+        keep_out = np.array(self.keep_out, dtype=bool)
+        ok = ~(inside & keep_out).any(axis=1)
+        if not keep_out.all():
+            ok &= (inside & ~keep_out).any(axis=1)
+        return ok, np.where(ok, distance, -distance), zone
+
+    def evaluate_track(self, time, lat, lon):
+        """Check a whole track: (ok, margin, first_violation) where
+        first_violation is the first time a fix was not allowed, or None"""
+        import numpy as np
+        ok, margin, _ = self.check_track(lat, lon)
+        bad = np.flatnonzero(~ok)
+        first_violation = float(np.asarray(time).ravel()[bad[0]]) if len(bad) else None
+        return ok, margin, first_violation
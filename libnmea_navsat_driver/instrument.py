@@ -0,0 +1,159 @@
+import time
+import logging
+logger = logging.getLogger('out')
+
+
+# Points in the pipeline at which LatencyTracker measures, in order
+LATENCY_STAGES = ('frame', 'checksum', 'parse', 'fix', 'usrfun', 'write')
+# Stages StageProfiler times. Each is the time since the one before it:
+# reading the port, framing, the checksum, parsing, the rest of the driver,
+# usrfun and writing the log.
+PROFILE_STAGES = ('read', 'frame', 'checksum', 'parse', 'driver', 'usrfun', 'write')
+REPORT_PERCENTILES = (50.0, 90.0, 99.0, 99.9)
+
+
+class LatencyHistogram(object):
+    """Histogram of non-negative integer latencies (ns) in fixed memory.
+
+    Buckets are HDR-style: values below 2 * 2**sub_bucket_bits are counted
+    exactly, and above that every power of two is split into
+    2**sub_bucket_bits linear buckets, so a percentile is within
+    1 / 2**sub_bucket_bits of the true value (about 3% for the default 5)
+    however long the run. Values over 2**max_bits ns go in the last bucket;
+    count, total, min and max are kept exactly.
+    """
+
+    def __init__(self, sub_bucket_bits=5, max_bits=40):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_buckets = 1 << sub_bucket_bits
+        self.counts = [0] * ((max_bits - sub_bucket_bits + 1) * self.sub_buckets)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def index(self, value):
+        shift = value.bit_length() - self.sub_bucket_bits - 1
+        if shift <= 0:
+            return value
+        return min(shift * self.sub_buckets + (value >> shift),
+                   len(self.counts) - 1)
+
+    # Smallest and largest value counted in bucket i
+    def bucket_range(self, i):
+        shift = max(0, i // self.sub_buckets - 1)
+        low = (i - shift * self.sub_buckets) << shift
+        return low, low + (1 << shift) - 1
+
+    def record(self, value):
+        value = max(0, int(value))
+        self.counts[self.index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        if self.count == 0:
+            return float('NaN')
+        rank = max(1, int(round(p / 100.0 * self.count)))
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                low, high = self.bucket_range(i)
+                return min(max((low + high) / 2.0, self.min), self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else float('NaN')
+
+
+class LatencyTracker(object):
+    """Latency of each fix from the arrival of the first byte of its frame
+    to each of LATENCY_STAGES, on the monotonic clock.
+
+    The code being measured sets start (in ns from clock) when a frame's
+    first byte is read and calls mark(stage) as the frame passes each stage.
+    Stages it does not track are ignored.
+    """
+
+    def __init__(self, clock=time.perf_counter_ns, stages=LATENCY_STAGES):
+        self.clock = clock
+        self.stages = stages
+        self.histograms = dict((stage, LatencyHistogram()) for stage in stages)
+        self.start = None
+
+    def mark(self, stage):
+        if self.start is not None and stage in self.histograms:
+            self.histograms[stage].record(self.clock() - self.start)
+
+    def report(self):
+        """Percentile table in microseconds, one line per stage"""
+        lines = ["Latency from first byte (us)  " + "".join(
+            "%9s" % ("p%g" % p) for p in REPORT_PERCENTILES) + "%9s%9s" % ("max", "count")]
+        for stage in self.stages:
+            histogram = self.histograms[stage]
+            if not histogram.count:
+                continue
+            lines.append("  %-28s" % stage + "".join(
+                "%9.0f" % (histogram.percentile(p) / 1e3) for p in REPORT_PERCENTILES) +
+                "%9.0f%9d" % (histogram.max / 1e3, histogram.count))
+        return "\n".join(lines)
+
+
+class StageCounter(object):
+    """Calls, total and maximum time (ns) of one stage"""
+
+    __slots__ = ('calls', 'total', 'max')
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, elapsed):
+        self.calls += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+
+class StageProfiler(object):
+    """Where the time goes, by stage of the pipeline.
+
+    Same mark(stage) interface as LatencyTracker, but each mark adds the
+    time since the previous mark to a StageCounter for stage, so the
+    counters split the whole run between PROFILE_STAGES. Stages it does not
+    track are ignored.
+    """
+
+    def __init__(self, clock=time.perf_counter_ns, stages=PROFILE_STAGES):
+        self.clock = clock
+        self.stages = stages
+        self.counters = dict((stage, StageCounter()) for stage in stages)
+        self.start = None
+        self.last = clock()
+
+    def mark(self, stage):
+        counter = self.counters.get(stage)
+        if counter is not None:
+            now = self.clock()
+            counter.add(now - self.last)
+            self.last = now
+
+    def report(self):
+        """Table of calls, total, mean and max time per stage"""
+        total = sum(counter.total for counter in self.counters.values()) or 1
+        lines = ["Stage           calls   total ms       %   mean us    max us"]
+        for stage in self.stages:
+            counter = self.counters[stage]
+            if not counter.calls:
+                continue
+            lines.append("  %-10s%10d%11.1f%8.1f%10.1f%10.1f" % (
+                stage, counter.calls, counter.total / 1e6,
+                100.0 * counter.total / total,
+                counter.total / counter.calls / 1e3, counter.max / 1e3))
+        return "\n".join(lines)
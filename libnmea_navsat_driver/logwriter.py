@@ -0,0 +1,238 @@
+import importlib
+import os
+import queue
+import shutil
+import threading
+import time
+from itertools import chain
+import logging
+logger = logging.getLogger('out')
+
+
+CSV_HEADER = "time,fix,NumSat,latitude,longitude,altitude,speed,ground_course,covariance\n"
+_ROW_FORMAT = "%s,%s,%s,%s,%s,%s,%s,%s,%s\n"
+
+# When to call os.fsync:
+#   'never'  leave it to the OS (fastest, a power cut loses what it had cached)
+#   'flush'  after every flush (at most flush_rows / flush_interval is lost)
+#   'close'  only when the log is closed
+FSYNC_POLICIES = ('never', 'flush', 'close')
+
+# Compression of closed log segments: module (imported when first used, to
+# keep it out of startup) -> file extension
+COMPRESSORS = {'gzip': '.gz', 'lzma': '.xz'}
+
+
+def format_rows(rows, row_format=_ROW_FORMAT):
+    """Format a block of fixes as CSV text in one go. rows is a sequence of
+    fix tuples or a fixbuffer structured array. Values are written with
+    str(), the same as the original gpslog rows."""
+    if hasattr(rows, 'tolist'):
+        rows = rows.tolist()
+    return (row_format * len(rows)) % tuple(chain.from_iterable(rows))
+
+
+class CSVLogWriter(object):
+    """Buffered CSV log of fixes.
+
+    write() formats the row and queues it. Queued rows are written as one
+    block when flush_rows have queued up or flush_interval seconds have
+    passed since the last flush (checked on write and by poll()), so the file
+    is touched at a known, bounded rate instead of whenever the file buffer
+    happens to fill. bytes_written includes the queued rows. fsync is one of
+    FSYNC_POLICIES. Rows must have one value per column of header.
+    """
+
+    def __init__(self, path, flush_rows=50, flush_interval=1.0, fsync='never',
+                 header=CSV_HEADER):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError("Unknown fsync policy %r, expected one of %s"
+                             % (fsync, ', '.join(FSYNC_POLICIES)))
+        self.path = path
+        self.flush_rows = max(1, int(flush_rows))
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.row_format = ",".join(["%s"] * header.count(",") + ["%s\n"])
+        self.pending = []
+        self.pending_rows = 0
+        self.rows_written = 0
+        self.flushes = 0
+        self.max_flush_time = 0.0
+        self.file = open(path, "w")
+        self.file.write(header)
+        self.bytes_written = len(header)
+        self.last_flush = time.monotonic()
+
+    def write(self, fix):
+        if type(fix) is not tuple:
+            # e.g. a fixbuffer.FixView; formatting needs a tuple
+            fix = tuple(fix)
+        text = self.row_format % fix
+        self.pending.append(text)
+        self.pending_rows += 1
+        self.bytes_written += len(text)
+        if self.pending_rows >= self.flush_rows:
+            self.flush()
+        elif time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def write_block(self, rows):
+        """Queue many fixes at once (a list of tuples or a structured array)"""
+        text = format_rows(rows, self.row_format)
+        self.pending.append(text)
+        self.pending_rows += len(rows)
+        self.bytes_written += len(text)
+        if self.pending_rows >= self.flush_rows:
+            self.flush()
+
+    # Flush if flush_interval has passed, for callers with a timer
+    def poll(self):
+        if self.pending and time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        start = time.monotonic()
+        if self.pending:
+            self.file.write(''.join(self.pending))
+            self.rows_written += self.pending_rows
+            self.pending = []
+            self.pending_rows = 0
+        self.file.flush()
+        if self.fsync == 'flush':
+            os.fsync(self.file.fileno())
+        self.last_flush = time.monotonic()
+        self.flushes += 1
+        self.max_flush_time = max(self.max_flush_time, self.last_flush - start)
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush()
+        if self.fsync == 'close':
+            os.fsync(self.file.fileno())
+        self.file.close()
+
+    def stats(self):
+        return {'rows': self.rows_written + self.pending_rows,
+                'flushes': self.flushes,
+                'max_flush_ms': self.max_flush_time * 1e3}
+
+
+class RotatingLogWriter(object):
+    """A log split into numbered segments, base-0001.csv, base-0002.csv, ...
+
+    open_segment(path) opens one segment and returns its writer (a
+    CSVLogWriter or binlog.BinaryLogWriter). A new segment is started once
+    the current one holds max_bytes or has been open max_seconds (None for
+    no limit). With compress ('gzip' or 'lzma'), closed segments are
+    compressed by a background thread, so writing never waits for it.
+
+    index_path is a csv file listing each finished segment with its number
+    of rows and the first and last fix time (column time_column of the
+    rows). A segment is listed once it is in its final form, compressed or
+    not. close() waits for the compression to finish.
+    """
+
+    def __init__(self, open_segment, base, extension, index_path,
+                 max_bytes=None, max_seconds=None, compress=None, time_column=0):
+        if compress is not None and compress not in COMPRESSORS:
+            raise ValueError("Unknown compression %r, expected one of %s"
+                             % (compress, ', '.join(COMPRESSORS)))
+        self.open_segment = open_segment
+        self.base = base
+        self.extension = extension
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.compress = compress
+        self.time_column = time_column
+        self.segment = 0
+        self.writer = None
+        self.index = open(index_path, "w")
+        self.index.write("segment,rows,first_time,last_time\n")
+        self.index.flush()
+        self.index_lock = threading.Lock()
+        self.closed_segments = queue.Queue()
+        self.compressor = None
+        if compress is not None:
+            self.compressor = threading.Thread(target=self.compress_segments,
+                                               name='LogCompressor')
+            self.compressor.daemon = True
+            self.compressor.start()
+        self.rotate()
+
+    def rotate(self):
+        if self.writer is not None:
+            self.finish_segment()
+        self.segment += 1
+        self.path = "%s-%04d%s" % (self.base, self.segment, self.extension)
+        self.writer = self.open_segment(self.path)
+        self.opened = time.monotonic()
+        self.rows = 0
+        self.first_time = None
+        self.last_time = None
+
+    def finish_segment(self):
+        self.writer.close()
+        segment = (self.path, self.rows, self.first_time, self.last_time)
+        if self.compressor is not None:
+            self.closed_segments.put(segment)
+        else:
+            self.add_to_index(*segment)
+
+    def add_to_index(self, path, rows, first_time, last_time):
+        with self.index_lock:
+            self.index.write("%s,%d,%s,%s\n" % (os.path.basename(path), rows,
+                                                first_time, last_time))
+            self.index.flush()
+
+    def compress_segments(self):
+        open_compressed = importlib.import_module(self.compress).open
+        extension = COMPRESSORS[self.compress]
+        while True:
+            segment = self.closed_segments.get()
+            if segment is None:
+                return
+            path = segment[0]
+            try:
+                with open(path, 'rb') as source, \
+                        open_compressed(path + extension, 'wb') as target:
+                    shutil.copyfileobj(source, target, 1 << 20)
+                os.remove(path)
+                path += extension
+            except (OSError, EOFError) as e:
+                logger.error("Could not compress %s: %s", path, e)
+            self.add_to_index(path, *segment[1:])
+
+    def due(self):
+        return ((self.max_bytes is not None and
+                 self.writer.bytes_written >= self.max_bytes) or
+                (self.max_seconds is not None and
+                 time.monotonic() - self.opened >= self.max_seconds))
+
+    def write(self, fix):
+        if self.due():
+            self.rotate()
+        self.writer.write(fix)
+        if self.first_time is None:
+            self.first_time = fix[self.time_column]
+        self.last_time = fix[self.time_column]
+        self.rows += 1
+
+    def poll(self):
+        if self.rows and self.due():
+            self.rotate()
+        else:
+            self.writer.poll()
+
+    def flush(self):
+        self.writer.flush()
+
+    def close(self):
+        if self.writer is None:
+            return
+        self.finish_segment()
+        self.writer = None
+        if self.compressor is not None:
+            self.closed_segments.put(None)
+            self.compressor.join()
+        self.index.close()
@@ -0,0 +1,79 @@
+import selectors
+import time
+import logging
+logger = logging.getLogger('out')
+
+from libnmea_navsat_driver.framer import StreamDecoder
+from libnmea_navsat_driver.driver import NMEADriver
+
+
+class MultiPortReader(object):
+    """Reads several serial ports from one thread.
+
+    Each port gets its own StreamDecoder (and so its own driver state).
+    poll() waits with a selector until any port has data, reads every port
+    that is ready and returns the new fixes as (port index, fix) pairs in
+    timestamp order, so the result of successive polls is one merged stream
+    ordered on a single clock.
+
+    Ports with a clock() method (capture.CapturingPort) timestamp their own
+    data; the others use clock. Where ports cannot be used with a selector
+    (Windows) they are polled every poll_interval seconds instead.
+    assemble_epochs is passed on to each port's NMEADriver.
+    """
+
+    def __init__(self, ports, clock=time.time, poll_interval=0.01,
+                 assemble_epochs=False):
+        self.ports = list(ports)
+        self.decoders = [StreamDecoder(NMEADriver(assemble_epochs=assemble_epochs))
+                         for _ in self.ports]
+        self.clock = clock
+        self.poll_interval = poll_interval
+        self.selector = selectors.DefaultSelector()
+        for index, port in enumerate(self.ports):
+            port.timeout = 0
+            try:
+                self.selector.register(port.fileno(), selectors.EVENT_READ, index)
+            except (AttributeError, ValueError, OSError):
+                logger.debug("Polling port %d, it cannot be selected", index)
+                self.selector.close()
+                self.selector = None
+                break
+
+    # Wait up to timeout seconds (None: until there is data) and return the
+    # fixes from the data read
+    def poll(self, timeout=None):
+        if self.selector is not None:
+            ready = [key.data for key, _ in self.selector.select(timeout)]
+        else:
+            ready = [index for index, port in enumerate(self.ports)
+                     if port.in_waiting]
+            if not ready:
+                time.sleep(self.poll_interval if timeout is None
+                           else min(timeout, self.poll_interval))
+        fixes = []
+        for index in ready:
+            port = self.ports[index]
+            data = port.read(port.in_waiting or 1)
+            if not data:
+                continue
+            clock = getattr(port, 'clock', self.clock)
+            for fix in self.decoders[index].feed(data, clock()):
+                fixes.append((index, fix))
+        if len(ready) > 1:
+            fixes.sort(key=lambda item: item[1][0])
+        return fixes
+
+    # The fixes still held by the drivers, as (port index, fix) pairs in
+    # timestamp order, when reading stops
+    def flush(self):
+        fixes = [(index, fix) for index, decoder in enumerate(self.decoders)
+                 for fix in decoder.flush()]
+        fixes.sort(key=lambda item: item[1][0])
+        return fixes
+
+    def close(self):
+        if self.selector is not None:
+            self.selector.close()
+        for port in self.ports:
+            port.close()
@@ -35,6 +35,7 @@ import time
 import calendar
 import math
 import logging
+from collections.abc import Mapping
 logger = logging.getLogger('out')
 
 
@@ -60,22 +61,88 @@ def convert_longitude(field):
     return safe_float(field[0:3]) + safe_float(field[3:]) / 60.0
 
 
+class UTCClock(object):
+    """Turns NMEA "hhmmss.ss" UTC times into unix time.
+
+    The date comes from set_date (RMC date field or ZDA) once the receiver
+    has sent one; before that the system date is used, moved by a day if the
+    GPS and system clocks are on different sides of midnight. The unix time of
+    the current UTC midnight is cached, and a time of day that jumps back by
+    more than 12 hours moves it on to the next day.
+
+    Each NMEADriver has its own clock, passed to parse_nmea_sentence and
+    parse_nmea_bytes, which set its date from RMC and ZDA sentences before
+    converting their time.
+    """
+
+    def __init__(self):
+        self.midnight = None
+        self.last_seconds = None
+
+    def set_date(self, midnight):
+        """midnight: unix time of 00:00:00 UTC on the current date, as
+        returned by convert_date"""
+        self.midnight = int(midnight)
+        # The date is now known, so the next time must not move it again
+        self.last_seconds = None
+
+    def convert(self, nmea_utc):
+        # If one of the time fields is empty, return NaN seconds
+        if len(nmea_utc) < 6:
+            return float('NaN')
+        hhmmss = int(nmea_utc[0:6])
+        seconds = hhmmss // 10000 * 3600 + hhmmss // 100 % 100 * 60 + hhmmss % 100
+
+        if self.midnight is None:
+            self.midnight = self.system_midnight(seconds)
+        elif self.last_seconds is not None:
+            if seconds < self.last_seconds - 43200:
+                self.midnight += 86400
+            elif seconds > self.last_seconds + 43200:
+                self.midnight -= 86400
+        self.last_seconds = seconds
+
+        unix_time = self.midnight + seconds
+        # Fractional seconds, e.g. the "50" in "123456.50"
+        if len(nmea_utc) > 7:
+            fraction = nmea_utc[7:]
+            unix_time += int(fraction) / 10.0 ** len(fraction)
+        return unix_time
+
+    @staticmethod
+    def system_midnight(seconds):
+        """UTC midnight of the system date, for a GPS time of day of seconds"""
+        now = time.time()
+        midnight = int(now) // 86400 * 86400
+        if seconds - (now - midnight) > 43200:
+            # GPS is still before midnight, the system clock already after
+            midnight -= 86400
+        elif seconds - (now - midnight) < -43200:
+            midnight += 86400
+        return midnight
+
+
 def convert_time(nmea_utc):
-    # Get current time in UTC for date information
-    utc_struct = time.gmtime()  # immutable, so cannot modify this one
-    utc_list = list(utc_struct)
-    # If one of the time fields is empty, return NaN seconds
-    if not nmea_utc[0:2] or not nmea_utc[2:4] or not nmea_utc[4:6]:
+    """UTC time of day to unix time on the system date. The parse functions
+    use their clock argument instead, see UTCClock."""
+    return UTCClock().convert(nmea_utc)
+
+
+def utc_midnight(year, month, day):
+    """Unix time of 00:00:00 UTC on a date, NaN if it is not a valid date"""
+    if not (1 <= year and 1 <= month <= 12 and
+            1 <= day <= calendar.monthrange(year, month)[1]):
         return float('NaN')
-    else:
-        hours = int(nmea_utc[0:2])
-        minutes = int(nmea_utc[2:4])
-        seconds = int(nmea_utc[4:6])
-        utc_list[3] = hours
-        utc_list[4] = minutes
-        utc_list[5] = seconds
-        unix_time = calendar.timegm(tuple(utc_list))
-        return unix_time
+    return calendar.timegm((year, month, day, 0, 0, 0))
+
+
+def convert_date(nmea_date):
+    """Unix time of 00:00:00 UTC on an NMEA "ddmmyy" date, NaN if empty or
+    not a valid date"""
+    if len(nmea_date) < 6:
+        return float('NaN')
+    ddmmyy = safe_int(nmea_date[0:6])
+    return utc_midnight(2000 + ddmmyy % 100, ddmmyy // 100 % 100, ddmmyy // 10000)
 
 
 def convert_status_flag(status_flag):
@@ -95,9 +162,22 @@ def convert_knots_to_mps(knots):
 def convert_deg_to_rads(degs):
     return math.radians(safe_float(degs))
 
+def convert_satellite_ids(fields):
+    """PRNs of the satellites used for the fix (GSA), empty fields left out"""
+    return [int(field) for field in fields if field]
+
+
+def convert_satellites_in_view(fields):
+    """(prn, elevation, azimuth, snr) for each satellite block of a GSV
+    sentence. snr is NaN for satellites that are not being tracked."""
+    return [(safe_int(fields[i]), safe_int(fields[i + 1]),
+             safe_int(fields[i + 2]), safe_float(fields[i + 3]))
+            for i in range(0, len(fields) - 3, 4) if fields[i]]
+
 """Format for this is a sentence identifier (e.g. "GGA") as the key, with a
 tuple of tuples where each tuple is a field name, conversion function and index
-into the split sentence"""
+into the split sentence. The index can also be a slice for a variable number of
+fields, in which case the conversion function gets a list."""
 parse_maps = {
     "GGA": [
         ("fix_type", int, 6),
@@ -120,17 +200,71 @@ parse_maps = {
         ("longitude_direction", str, 6),
         ("speed", convert_knots_to_mps, 7),
         ("true_course", convert_deg_to_rads, 8),
-        ]
+        ("utc_date", convert_date, 9),
+        ],
+    "GSA": [
+        ("fix_mode", safe_int, 2),
+        ("satellites", convert_satellite_ids, slice(3, 15)),
+        ("pdop", safe_float, 15),
+        ("hdop", safe_float, 16),
+        ("vdop", safe_float, 17),
+        ],
+    "GSV": [
+        ("num_messages", safe_int, 1),
+        ("message_number", safe_int, 2),
+        ("num_satellites_in_view", safe_int, 3),
+        ("satellites", convert_satellites_in_view, slice(4, None)),
+        ],
+    "VTG": [
+        ("true_course", convert_deg_to_rads, 1),
+        ("magnetic_course", convert_deg_to_rads, 3),
+        ("speed", convert_knots_to_mps, 5),
+        ],
+    "GLL": [
+        ("latitude", convert_latitude, 1),
+        ("latitude_direction", str, 2),
+        ("longitude", convert_longitude, 3),
+        ("longitude_direction", str, 4),
+        ("utc_time", convert_time, 5),
+        ("fix_valid", convert_status_flag, 6),
+        ],
+    "ZDA": [
+        ("utc_time", convert_time, 1),
+        ("day", safe_int, 2),
+        ("month", safe_int, 3),
+        ("year", safe_int, 4),
+        ],
     }
 
 
-def parse_nmea_sentence(nmea_sentence):
+def _set_clock_date(clock, sentence_type, fields):
+    # RMC and ZDA carry the date, which has to be set before their own time
+    # is converted
+    if sentence_type == "RMC":
+        if len(fields) > 9:
+            midnight = convert_date(fields[9])
+            if not math.isnan(midnight):
+                clock.set_date(midnight)
+    elif sentence_type == "ZDA":
+        if len(fields) > 4:
+            midnight = utc_midnight(safe_int(fields[4]), safe_int(fields[3]),
+                                    safe_int(fields[2]))
+            if not math.isnan(midnight):
+                clock.set_date(midnight)
+
+
+# clock: the UTCClock that converts utc_time fields, normally the driver's.
+# Without one, each sentence is converted on its own (RMC and ZDA on their
+# own date, other sentences on the system date).
+def parse_nmea_sentence(nmea_sentence, clock=None):
     # Check for a valid nmea sentence
     if not re.match('(^\$GP|^\$GN|^\$GL).*\*[0-9A-Fa-f]{2}$', nmea_sentence):
         logger.debug("Regex didn't match, sentence not valid NMEA? Sentence was: %s"
                      % repr(nmea_sentence))
         return False
-    fields = [field.strip(',') for field in nmea_sentence.split(',')]
+    # Leave out the *HH checksum so that it does not end up in the last field
+    fields = [field.strip(',') for field in
+              nmea_sentence[:nmea_sentence.rindex('*')].split(',')]
 
     # Ignore the $ and talker ID portions (e.g. GP)
     sentence_type = fields[0][3:]
@@ -141,9 +275,398 @@ def parse_nmea_sentence(nmea_sentence):
         return False
 
     parse_map = parse_maps[sentence_type]
+    if clock is None:
+        clock = UTCClock()
+    _set_clock_date(clock, sentence_type, fields)
 
     parsed_sentence = {}
     for entry in parse_map:
-        parsed_sentence[entry[0]] = entry[1](fields[entry[2]])
+        if entry[1] is convert_time:
+            parsed_sentence[entry[0]] = clock.convert(fields[entry[2]])
+        else:
+            parsed_sentence[entry[0]] = entry[1](fields[entry[2]])
 
     return {sentence_type: parsed_sentence}
+
+
+# Talker IDs accepted by parse_nmea_bytes, same as the regex above
+_TALKER_PREFIXES = (b'$GP', b'$GN', b'$GL')
+_HEX_DIGITS = frozenset(b'0123456789ABCDEFabcdef')
+
+
+def _decode_field(field):
+    return field.decode('ascii', 'replace')
+
+
+def _convert_status_flag_bytes(status_flag):
+    return status_flag == b"A"
+
+
+def _convert_latitude_bytes(field):
+    try:
+        return float(field[0:2]) + float(field[2:]) / 60.0
+    except ValueError:
+        return convert_latitude(field)
+
+
+def _convert_longitude_bytes(field):
+    try:
+        return float(field[0:3]) + float(field[3:]) / 60.0
+    except ValueError:
+        return convert_longitude(field)
+
+
+# Converters in parse_maps that only work on str or have a cheaper bytes
+# version. Everything else goes through float()/int(), which accept bytes
+# directly.
+_bytes_converters = {
+    str: _decode_field,
+    convert_status_flag: _convert_status_flag_bytes,
+    convert_latitude: _convert_latitude_bytes,
+    convert_longitude: _convert_longitude_bytes,
+}
+
+
+def _num_fields(parse_map):
+    """Number of fields a sentence needs for parse_map"""
+    return max(entry[2].start if isinstance(entry[2], slice) else entry[2] + 1
+               for entry in parse_map)
+
+
+def _compile_parse_maps(maps):
+    """Build the dispatch table for parse_nmea_bytes from a parse map dict.
+    Keys are the sentence type as bytes, values are (sentence_type, entries,
+    number of fields needed), with entries a dict of field name to
+    (conversion function, index) as used by LazySentence."""
+    table = {}
+    for sentence_type, parse_map in maps.items():
+        entries = dict((entry[0], (_bytes_converters.get(entry[1], entry[1]),
+                                   entry[2])) for entry in parse_map)
+        table[sentence_type.encode('ascii')] = (sentence_type, entries,
+                                                _num_fields(parse_map))
+    return table
+
+_bytes_parse_table = _compile_parse_maps(parse_maps)
+
+
+class LazySentence(Mapping):
+    """Read-only dict of one parsed sentence, as returned by parse_nmea_bytes.
+
+    Only the split of the sentence into raw fields happens up front. A
+    field's conversion function runs the first time it is read, and the
+    result is kept, so fields nobody reads (most of GSV/GSA) cost nothing.
+    dict(sentence) gives the same dict as parse_nmea_sentence.
+    """
+
+    __slots__ = ('fields', 'entries', 'values')
+
+    def __init__(self, fields, entries):
+        self.fields = fields
+        self.entries = entries
+        self.values = {}
+
+    def __getitem__(self, name):
+        try:
+            return self.values[name]
+        except KeyError:
+            func, index = self.entries[name]
+            value = self.values[name] = func(self.fields[index])
+            return value
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return 'LazySentence(%r)' % dict(self)
+
+
+def _check_framing(nmea_sentence):
+    # Check for a valid nmea sentence: talker prefix and *HH at the end
+    return (nmea_sentence[:3] in _TALKER_PREFIXES and
+            nmea_sentence[-3:-2] == b'*' and
+            nmea_sentence[-2] in _HEX_DIGITS and
+            nmea_sentence[-1] in _HEX_DIGITS)
+
+
+def parse_nmea_bytes(nmea_sentence, clock=None):
+    """Same as parse_nmea_sentence, but for bytes, bytearray or memoryview
+    input (e.g. straight from serial.Serial.readline). Framing is checked with
+    plain byte comparisons instead of a regex and the sentence type is looked
+    up in a table compiled from parse_maps. Fields are decoded lazily, see
+    LazySentence, except utc_time: it is converted right away so that the
+    clock sees the sentences in order."""
+    if type(nmea_sentence) is not bytes:
+        nmea_sentence = bytes(nmea_sentence)
+    # readline() leaves the line ending on
+    nmea_sentence = nmea_sentence.rstrip(b'\r\n')
+
+    if not _check_framing(nmea_sentence):
+        logger.debug("Framing check failed, sentence not valid NMEA? "
+                     "Sentence was: %r", nmea_sentence)
+        return False
+    fields = nmea_sentence[:-3].split(b',')
+
+    # Ignore the $ and talker ID portions (e.g. GP)
+    try:
+        sentence_type, entries, num_fields = _bytes_parse_table[fields[0][3:]]
+    except KeyError:
+        logger.debug("Sentence type %r not in parse map, ignoring.",
+                     fields[0][3:])
+        return False
+
+    if len(fields) < num_fields:
+        logger.debug("Sentence has %d fields, expected at least %d. "
+                     "Sentence was: %r", len(fields), num_fields,
+                     nmea_sentence)
+        return False
+
+    sentence = LazySentence(fields, entries)
+    if clock is None:
+        clock = UTCClock()
+    _set_clock_date(clock, sentence_type, fields)
+    if 'utc_time' in entries:
+        sentence.values['utc_time'] = clock.convert(fields[entries['utc_time'][1]])
+    return {sentence_type: sentence}
+
+
+# Batch decoding. numpy is only imported when one of these is called so that
+# the live path does not pay for it.
+
+def _slice_column(column, start, stop=None):
+    """column[i][start:stop] for every entry of a bytes ('S') array"""
+    import numpy as np
+    width = column.dtype.itemsize
+    stop = width if stop is None else min(stop, width)
+    start = min(start, stop)
+    if start == stop:
+        return np.zeros(len(column), dtype='S1')
+    chars = column.view(np.uint8).reshape(len(column), width)[:, start:stop]
+    return np.ascontiguousarray(chars).view('S%d' % (stop - start)).ravel()
+
+
+def _vec_safe_float(column):
+    import numpy as np
+    try:
+        return np.where(column == b'', b'nan', column).astype(np.float64)
+    except ValueError:
+        return np.array([safe_float(field) for field in column], dtype=np.float64)
+
+
+def _vec_safe_int(column):
+    import numpy as np
+    try:
+        return np.where(column == b'', b'0', column).astype(np.int64)
+    except ValueError:
+        return np.array([safe_int(field) for field in column], dtype=np.int64)
+
+
+def _vec_str(column):
+    return column.astype('U')
+
+
+def _vec_latitude(column):
+    return _vec_safe_float(_slice_column(column, 0, 2)) + \
+        _vec_safe_float(_slice_column(column, 2)) / 60.0
+
+
+def _vec_longitude(column):
+    return _vec_safe_float(_slice_column(column, 0, 3)) + \
+        _vec_safe_float(_slice_column(column, 3)) / 60.0
+
+
+def _vec_time(column):
+    # Seconds since UTC midnight of the first day in the column, counting day
+    # rollovers the same way UTCClock.convert does. parse_nmea_batch adds the
+    # date afterwards.
+    import numpy as np
+    hhmmss = _vec_safe_int(_slice_column(column, 0, 6))
+    seconds = hhmmss // 10000 * 3600 + hhmmss // 100 % 100 * 60 + hhmmss % 100
+    missing = np.char.str_len(column) < 6
+
+    timed = np.flatnonzero(~missing)
+    steps = np.diff(seconds[timed])
+    days = np.zeros(len(column), dtype=np.int64)
+    days[timed[1:]] = np.cumsum((steps < -43200).astype(np.int64) -
+                                (steps > 43200))
+
+    fraction = _vec_safe_float(np.char.add(b'0.', _slice_column(column, 7)))
+    return np.where(missing, np.nan, seconds + 86400 * days + fraction)
+
+
+def _vec_date(column):
+    # Same as convert_date, with the days from 1970-01-01 worked out from
+    # year/month/day in integer arithmetic (civil calendar, March based years)
+    import numpy as np
+    ddmmyy = _vec_safe_int(_slice_column(column, 0, 6))
+    day = ddmmyy // 10000
+    month = ddmmyy // 100 % 100
+    year = 2000 + ddmmyy % 100 - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * ((month + 9) % 12) + 2) // 5 + day - 1
+    day_of_era = (year_of_era * 365 + year_of_era // 4 - year_of_era // 100 +
+                  day_of_year)
+    days = era * 146097 + day_of_era - 719468
+    # Not a date (e.g. 000000): NaN, as in convert_date
+    month_days = np.array([0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+    leap = (ddmmyy % 100) % 4 == 0
+    invalid = ((month < 1) | (month > 12) | (day < 1) |
+               (day > month_days[np.clip(month, 0, 12)]) |
+               ((month == 2) & (day == 29) & ~leap))
+    return np.where((np.char.str_len(column) < 6) | invalid, np.nan, 86400.0 * days)
+
+
+def _vec_status_flag(column):
+    return column == b"A"
+
+
+def _vec_knots_to_mps(column):
+    return _vec_safe_float(column) * 0.514444444444
+
+
+def _vec_deg_to_rads(column):
+    import numpy as np
+    return np.radians(_vec_safe_float(column))
+
+
+# Column-wise equivalents of the parse_maps conversion functions. Sentence
+# types that use a function not listed here are skipped by parse_nmea_batch.
+# Empty int fields become 0 (safe_int) instead of raising like int() does.
+_batch_converters = {
+    int: _vec_safe_int,
+    safe_int: _vec_safe_int,
+    safe_float: _vec_safe_float,
+    str: _vec_str,
+    convert_latitude: _vec_latitude,
+    convert_longitude: _vec_longitude,
+    convert_time: _vec_time,
+    convert_date: _vec_date,
+    convert_status_flag: _vec_status_flag,
+    convert_knots_to_mps: _vec_knots_to_mps,
+    convert_deg_to_rads: _vec_deg_to_rads,
+}
+
+
+def _compile_batch_parse_maps(maps):
+    """Same as _compile_parse_maps, with the column-wise converters"""
+    table = {}
+    for sentence_type, parse_map in maps.items():
+        # Fields that hold lists (slice index) have no column form
+        parse_map = [entry for entry in parse_map
+                     if entry[1] in _batch_converters and
+                     not isinstance(entry[2], slice)]
+        if not parse_map:
+            continue
+        entries = tuple((entry[0], _batch_converters[entry[1]], entry[2])
+                        for entry in parse_map)
+        table[sentence_type.encode('ascii')] = (sentence_type, entries,
+                                                _num_fields(parse_map))
+    return table
+
+_batch_parse_table = _compile_batch_parse_maps(parse_maps)
+
+
+def parse_nmea_batch(sentences):
+    """Parse many NMEA sentences at once.
+
+    sentences is either a list of lines (str or bytes) or a single bytes
+    buffer holding newline separated sentences, e.g. a whole capture file.
+    Returns a dict with the sentence type (e.g. "GGA") as key and a NumPy
+    structured array as value, with one field per parse_maps entry and one
+    row per sentence in input order. Conversions run once per column instead
+    of once per field. Fields that hold lists (GSA/GSV satellites) are left
+    out. Sentences that fail the framing check or that are too
+    short are skipped; checksums are not verified (see check_nmea_checksum).
+    """
+    import numpy as np
+
+    if isinstance(sentences, (bytes, bytearray, memoryview)):
+        lines = bytes(sentences).splitlines()
+    else:
+        lines = [(line.encode('ascii', 'replace') if isinstance(line, str)
+                  else bytes(line)).strip() for line in sentences]
+
+    # Only keep the sentence types we can decode
+    rows = dict((key, []) for key in _batch_parse_table)
+    for line in lines:
+        key = line[3:line.find(b',')]
+        if key in rows and _check_framing(line):
+            rows[key].append(line[:-3])
+
+    parsed = {}
+    for key, type_lines in rows.items():
+        sentence_type, entries, num_fields = _batch_parse_table[key]
+
+        # Sentences with the same number of fields are split in one go: join
+        # them, split once and every count-th field is then one column
+        counts = np.array([line.count(b',') for line in type_lines], dtype=int) + 1
+        columns = dict((entry[0], []) for entry in entries)
+        rows_used = []
+        for count in np.unique(counts[counts >= num_fields]):
+            group = np.flatnonzero(counts == count)
+            fields = b','.join([type_lines[i] for i in group]).split(b',')
+            for name, func, index in entries:
+                column = np.array(fields[index::count], dtype=bytes)
+                columns[name].append(func(column))
+            rows_used.append(group)
+        if not rows_used:
+            continue
+
+        # Back to input order
+        order = np.argsort(np.concatenate(rows_used), kind='stable')
+        columns = [(entry[0], np.concatenate(columns[entry[0]])[order])
+                   for entry in entries]
+        array = np.empty(len(order), dtype=[(name, column.dtype)
+                                            for name, column in columns])
+        for name, column in columns:
+            array[name] = column
+        parsed[sentence_type] = array
+
+    _add_batch_dates(parsed)
+    return parsed
+
+
+def _add_batch_dates(parsed):
+    """utc_time from _vec_time counts from midnight of the first day in each
+    array. RMC rows carry their own date; the other sentence types take the
+    first RMC date in the batch, or the system date if there is none."""
+    import numpy as np
+
+    first_date = None
+    if 'RMC' in parsed:
+        rmc = parsed['RMC']
+        dated = np.flatnonzero(~np.isnan(rmc['utc_date']) &
+                               ~np.isnan(rmc['utc_time']))
+        if len(dated):
+            first_date = (rmc['utc_date'][dated[0]],
+                          rmc['utc_time'][dated[0]] % 86400)
+
+    for array in parsed.values():
+        if 'utc_time' not in array.dtype.names:
+            continue
+        utc_time = array['utc_time'].copy()
+        timed = np.flatnonzero(~np.isnan(utc_time))
+        if not len(timed):
+            continue
+
+        first_seconds = utc_time[timed[0]]
+        if first_date is None:
+            midnight = UTCClock.system_midnight(first_seconds)
+        else:
+            midnight = first_date[0]
+            if first_seconds - first_date[1] > 43200:
+                midnight -= 86400
+            elif first_seconds - first_date[1] < -43200:
+                midnight += 86400
+        array['utc_time'] = midnight + utc_time
+
+        if 'utc_date' in array.dtype.names:
+            dated = ~np.isnan(array['utc_date'])
+            array['utc_time'][dated] = (array['utc_date'][dated] +
+                                        utc_time[dated] % 86400)
@@ -0,0 +1,54 @@
+import math
+
+EARTH_RADIUS = 6371000.0
+DEG2RAD = math.pi / 180.0
+
+
+class LocalProjector(object):
+    """East/north meters relative to a fixed reference point.
+
+    The same flat-earth approximation as gpslogger.distance (good to well
+    under a meter over the few hundred meters of a flying field), with the
+    meters per degree of latitude and longitude at the reference computed
+    once. Single points go through plain float math; the *_batch methods
+    take numpy arrays (or anything numpy.asarray accepts) of any shape.
+    """
+
+    def __init__(self, lat0, lon0, radius=EARTH_RADIUS):
+        self.lat0 = lat0
+        self.lon0 = lon0
+        self.radius = radius
+        self.north_per_deg = radius * DEG2RAD
+        self.east_per_deg = radius * math.cos(lat0 * DEG2RAD) * DEG2RAD
+
+    def to_enu(self, lat, lon):
+        """(east, north) in meters"""
+        return ((lon - self.lon0) * self.east_per_deg,
+                (lat - self.lat0) * self.north_per_deg)
+
+    def to_latlon(self, east, north):
+        """Inverse of to_enu"""
+        return (self.lat0 + north / self.north_per_deg,
+                self.lon0 + east / self.east_per_deg)
+
+    def distance(self, lat, lon):
+        """(east, north, range) in meters, like gpslogger.distance(reference, pt)"""
+        east = (lon - self.lon0) * self.east_per_deg
+        north = (lat - self.lat0) * self.north_per_deg
+        return east, north, math.hypot(east, north)
+
+    def to_enu_batch(self, lat, lon):
+        import numpy as np
+        return ((np.asarray(lon, dtype=float) - self.lon0) * self.east_per_deg,
+                (np.asarray(lat, dtype=float) - self.lat0) * self.north_per_deg)
+
+    def to_latlon_batch(self, east, north):
+        import numpy as np
+        return (self.lat0 + np.asarray(north, dtype=float) / self.north_per_deg,
+                self.lon0 + np.asarray(east, dtype=float) / self.east_per_deg)
+
+    def distance_batch(self, lat, lon):
+        """(east, north, range) arrays for arrays of points"""
+        import numpy as np
+        east, north = self.to_enu_batch(lat, lon)
+        return east, north, np.hypot(east, north)
@@ -0,0 +1,103 @@
+import collections
+import queue
+import threading
+import time
+import logging
+logger = logging.getLogger('out')
+
+
+class FixQueue(object):
+    """Bounded, thread-safe queue of fixes between a reader thread and the
+    thread running usrfun.
+
+    policy decides what put() does when the queue is full:
+      'block'        wait for the consumer (the reader falls behind the port)
+      'drop-oldest'  drop the oldest queued fix
+      'latest'       keep only the newest fix (size 1), for control loops
+                     that should always act on the current position
+    depth, max_depth, dropped and put_count can be read at any time.
+    """
+
+    POLICIES = ('block', 'drop-oldest', 'latest')
+
+    def __init__(self, maxsize=64, policy='drop-oldest'):
+        if policy not in self.POLICIES:
+            raise ValueError("Unknown queue policy %r, expected one of %s"
+                             % (policy, ', '.join(self.POLICIES)))
+        self.policy = policy
+        self.maxsize = 1 if policy == 'latest' else max(1, int(maxsize))
+        self.items = collections.deque()
+        self.condition = threading.Condition()
+        self.put_count = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    @property
+    def depth(self):
+        return len(self.items)
+
+    def put(self, item):
+        if type(item) is not tuple:
+            # A fixbuffer.FixView is only valid until its buffer wraps
+            item = tuple(item)
+        with self.condition:
+            if len(self.items) >= self.maxsize:
+                if self.policy == 'block':
+                    while len(self.items) >= self.maxsize:
+                        self.condition.wait()
+                else:
+                    self.items.popleft()
+                    self.dropped += 1
+            self.items.append(item)
+            self.put_count += 1
+            self.max_depth = max(self.max_depth, len(self.items))
+            self.condition.notify_all()
+
+    # Oldest queued fix. Raises queue.Empty if none arrives within timeout
+    # seconds (None waits forever).
+    def get(self, timeout=None):
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.items, timeout):
+                raise queue.Empty
+            item = self.items.popleft()
+            self.condition.notify_all()
+            return item
+
+    def stats(self):
+        return {'depth': len(self.items), 'max_depth': self.max_depth,
+                'dropped': self.dropped, 'put': self.put_count}
+
+
+class SerialReader(threading.Thread):
+    """Reads a serial port in bulk, decodes it with a framer.StreamDecoder and
+    puts the fixes on a FixQueue, on its own thread, so the OS buffer is
+    drained however long the consumer takes.
+
+    clock gives the timestamp passed to the drivers (default time.time). An
+    exception from the port stops the thread and is kept in error.
+    """
+
+    def __init__(self, port, decoder, fixes, clock=time.time):
+        threading.Thread.__init__(self, name='SerialReader')
+        self.daemon = True
+        self.port = port
+        self.decoder = decoder
+        self.fixes = fixes
+        self.clock = clock
+        self.running = True
+        self.error = None
+
+    def run(self):
+        try:
+            while self.running:
+                data = self.port.read(self.port.in_waiting or 1)
+                if not data:
+                    continue
+                for fix in self.decoder.feed(data, self.clock()):
+                    self.fixes.put(fix)
+        except Exception as e:
+            logger.error("Serial reader stopped: %s", e)
+            self.error = e
+
+    def stop(self):
+        self.running = False
@@ -0,0 +1,101 @@
+import math
+
+from libnmea_navsat_driver.projection import EARTH_RADIUS, LocalProjector
+
+
+class RouteTracker(object):
+    """Follows a route, an ordered list of [lat, lon] points, fix by fix.
+
+    The route is kept as east/north meters from its first point, with the
+    direction and length of every segment and the distance along the route
+    to its start computed once. update() only compares the fix with the
+    segments up to search segments either side of the current one. If none
+    of those is within recover meters, or on the first fix, all segments
+    are compared at once with numpy to find where on the route the fix is.
+
+    After update(), segment, cross_track (meters right of the route,
+    negative to the left), along_track (meters along the route from its
+    start) and to_go (meters left to the end) describe the latest fix.
+    """
+
+    def __init__(self, points, search=2, recover=50.0, radius=EARTH_RADIUS):
+        points = [tuple(pt) for pt in points]
+        if len(points) < 2:
+            raise ValueError("A route needs at least 2 points, got %d" % len(points))
+        self.points = points
+        self.search = search
+        self.recover = recover
+        self.projector = LocalProjector(points[0][0], points[0][1], radius)
+        enu = [self.projector.to_enu(lat, lon) for lat, lon in points]
+
+        # segments as (east, north, unit east, unit north, length, start along route)
+        self.segments = []
+        along = 0.0
+        for (ax, ay), (bx, by) in zip(enu[:-1], enu[1:]):
+            length = math.hypot(bx - ax, by - ay)
+            if length > 0.0:
+                ux, uy = (bx - ax)/length, (by - ay)/length
+            else:
+                ux, uy = 0.0, 0.0
+            self.segments.append((ax, ay, ux, uy, length, along))
+            along += length
+        self.length = along
+        self.arrays = None
+        self.reset()
+
+    def reset(self):
+        """Forget the current segment, so the next fix searches the whole route"""
+        self.segment = None
+        self.cross_track = float('NaN')
+        self.along_track = float('NaN')
+        self.to_go = float('NaN')
+        self.recoveries = 0
+
+    def update(self, lat, lon):
+        """Locate the fix on the route, returns (segment, cross_track,
+        along_track, to_go)"""
+        px, py = self.projector.to_enu(lat, lon)
+        if self.segment is None:
+            segment = self.nearest_segment(px, py)
+        else:
+            first = max(0, self.segment - self.search)
+            last = min(len(self.segments), self.segment + self.search + 1)
+            best = float('inf')
+            segment = self.segment
+            for i in range(first, last):
+                d = self._distance(i, px, py)
+                if d <= best:  # on a tie (a corner) take the later segment
+                    best = d
+                    segment = i
+            if best > self.recover:
+                segment = self.nearest_segment(px, py)
+                self.recoveries += 1
+        self.segment = segment
+
+        ax, ay, ux, uy, length, along = self.segments[segment]
+        dx, dy = px - ax, py - ay
+        t = min(max(dx*ux + dy*uy, 0.0), length)
+        self.cross_track = dx*uy - dy*ux
+        self.along_track = along + t
+        self.to_go = self.length - self.along_track
+        return segment, self.cross_track, self.along_track, self.to_go
+
+    def _distance(self, i, px, py):
+        # distance from the point to segment i
+        ax, ay, ux, uy, length, _ = self.segments[i]
+        dx, dy = px - ax, py - ay
+        t = min(max(dx*ux + dy*uy, 0.0), length)
+        return math.hypot(dx - t*ux, dy - t*uy)
+
+    def nearest_segment(self, px, py):
+        """Index of the segment nearest to a point (east/north meters),
+        comparing all of them at once"""
+        import numpy as np
+        if self.arrays is None:
+            self.arrays = np.array(self.segments).T
+        ax, ay, ux, uy, length, _ = self.arrays
+        dx, dy = px - ax, py - ay
+        t = np.clip(dx*ux + dy*uy, 0.0, length)
+        d = np.hypot(dx - t*ux, dy - t*uy)
+        # the last of equally near segments, as in update()
+        return len(d) - 1 - int(np.argmin(d[::-1]))
@@ -0,0 +1,107 @@
+import collections
+import math
+import sys
+import threading
+import time
+import logging
+logger = logging.getLogger('out')
+
+
+class StatusDisplay(threading.Thread):
+    """Live status of the latest fix, redrawn at a fixed low rate by its own
+    thread, so the code handling fixes never writes to (or waits on) the
+    console.
+
+    update(fix) only stores the fix. alert(message) wakes the thread to print
+    the message at once, above the status block, where it stays. On a
+    terminal the block is redrawn in place with ANSI escape codes; otherwise
+    (output to a file or pipe) it is printed as one line per redraw.
+    counters is an optional function returning a dict of extra counters to
+    show.
+    """
+
+    def __init__(self, rate=2.0, stream=None, counters=None, ansi=None):
+        threading.Thread.__init__(self, name='StatusDisplay')
+        self.daemon = True
+        self.period = 1.0 / rate
+        self.stream = stream if stream is not None else sys.stdout
+        self.counters = counters
+        self.ansi = self.stream.isatty() if ansi is None else ansi
+        self.latest = None
+        self.fixes = 0
+        self.alerts = collections.deque(maxlen=100)
+        self.wake = threading.Event()
+        self.running = True
+        self.lines = 0  # height of the block drawn last
+        self.last_fixes = 0
+        self.last_draw = time.monotonic()
+        self.fix_rate = 0.0
+
+    def update(self, fix):
+        self.latest = fix
+        self.fixes += 1
+
+    def alert(self, message):
+        self.alerts.append(message)
+        self.wake.set()
+
+    def run(self):
+        next_draw = time.monotonic()
+        while self.running:
+            self.wake.wait(max(0.0, next_draw - time.monotonic()))
+            self.wake.clear()
+            now = time.monotonic()
+            if now >= next_draw:
+                next_draw = now + self.period
+                self.draw(status=True)
+            elif self.alerts:
+                self.draw(status=False)
+
+    def stop(self):
+        self.running = False
+        self.wake.set()
+        self.join(timeout=1.0)
+        self.draw(status=True)
+
+    def draw(self, status):
+        alerts = []
+        while self.alerts:
+            alerts.append(self.alerts.popleft())
+        if self.ansi:
+            # Alerts go above the status block, which is always redrawn
+            text = "\x1b[%dF\x1b[J" % self.lines if self.lines else ""
+            block = self.format()
+            text += "".join(line + "\n" for line in alerts + block)
+            self.lines = len(block)
+        else:
+            text = "".join(line + "\n" for line in alerts)
+            if status:
+                text += "  ".join(self.format()) + "\n"
+        try:
+            self.stream.write(text)
+            self.stream.flush()
+        except (OSError, ValueError) as e:
+            logger.debug("Status display could not write: %s", e)
+
+    def format(self):
+        now = time.monotonic()
+        fixes = self.fixes
+        if now - self.last_draw >= 0.5:
+            self.fix_rate = (fixes - self.last_fixes) / (now - self.last_draw)
+            self.last_fixes = fixes
+            self.last_draw = now
+        fix = self.latest
+        if fix is None:
+            lines = ["waiting for the first fix"]
+        else:
+            time_, ok, NumSat, lat, lon, alt, speed, course, covariance = fix
+            lines = [
+                "time %.1f s   fix %s   satellites %d   hdop %.2f" % (
+                    time_, 'yes' if ok else 'NO', NumSat, math.sqrt(covariance)
+                    if covariance >= 0 else float('NaN')),
+                "lat %.7f   lon %.7f   alt %.1f m" % (lat, lon, alt),
+                "speed %.2f m/s   course %.1f deg" % (speed, math.degrees(course))]
+        counters = "fixes %d (%.1f Hz)" % (fixes, self.fix_rate)
+        if self.counters is not None:
+            counters += "".join("   %s %s" % item for item in self.counters().items())
+        return lines + [counters]
@@ -0,0 +1,98 @@
+import math
+import struct
+from itertools import accumulate
+import logging
+logger = logging.getLogger('out')
+
+
+UBX_SYNC = b'\xb5\x62'
+UBX_HEADER = struct.Struct('<2sBBH')  # sync, class, id, payload length
+UBX_MAX_PAYLOAD = 1024  # longer lengths are taken to be garbage
+
+UBX_NAV_PVT = (0x01, 0x07)
+NAV_PVT = struct.Struct('<IHBBBBBBIiBBBBiiiiIIiiiiiIIH6xihH')
+
+NAV_PVT_FIELDS = (
+    'iTOW', 'year', 'month', 'day', 'hour', 'min', 'sec', 'valid', 'tAcc',
+    'nano', 'fixType', 'flags', 'flags2', 'numSV', 'lon', 'lat', 'height',
+    'hMSL', 'hAcc', 'vAcc', 'velN', 'velE', 'velD', 'gSpeed', 'headMot',
+    'sAcc', 'headAcc', 'pDOP', 'headVeh', 'magDec', 'magAcc')
+
+# Message classes of the u-blox protocol (NAV, RXM, INF, ACK, CFG, UPD, MON,
+# AID, TIM, ESF, MGA, LOG, SEC, HNR), and the payload length of messages
+# whose length is fixed, for telling a real header from line noise
+UBX_CLASSES = frozenset((0x01, 0x02, 0x04, 0x05, 0x06, 0x09, 0x0A, 0x0B,
+                         0x0D, 0x10, 0x13, 0x21, 0x27, 0x28))
+UBX_FIXED_LENGTHS = {UBX_NAV_PVT: NAV_PVT.size, (0x05, 0x00): 2, (0x05, 0x01): 2}
+
+
+def ubx_header_plausible(msg_class, msg_id, length):
+    """False if a header cannot start a real UBX message"""
+    if msg_class not in UBX_CLASSES or length > UBX_MAX_PAYLOAD:
+        return False
+    return UBX_FIXED_LENGTHS.get((msg_class, msg_id), length) == length
+
+
+def ubx_checksum(data):
+    """8-bit Fletcher checksum (CK_A, CK_B) of class, id, length and payload.
+    CK_B is the sum of the running sums of CK_A, so both are plain sums."""
+    return sum(data) & 0xFF, sum(accumulate(data)) & 0xFF
+
+
+def parse_nav_pvt(payload):
+    """Decode a UBX-NAV-PVT payload (bytes or memoryview) into a dict keyed
+    by the field names of the u-blox protocol specification, in its raw
+    units"""
+    return dict(zip(NAV_PVT_FIELDS, NAV_PVT.unpack_from(payload)))
+
+
+class UBXDriver(object):
+    """Turns UBX-NAV-PVT messages into the same fix output as
+    NMEADriver.add_sentence: (time, fix, NumSat, latitude, longitude,
+    altitude, speed, ground_course, covariance).
+
+    altitude is height above the ellipsoid, like the NMEA driver. NAV-PVT
+    has no HDOP, so covariance is PDOP**2 (PDOP >= HDOP).
+    """
+
+    def __init__(self, fix_buffer=None):
+        self.fix_buffer = fix_buffer
+
+    def output(self, time, fix, NumSat, latitude, longitude, altitude, speed,
+               ground_course, covariance):
+        if self.fix_buffer is None:
+            return (time, fix, NumSat, latitude, longitude, altitude, speed,
+                    ground_course, covariance)
+        return self.fix_buffer.view(self.fix_buffer.append(
+            time, fix, NumSat, latitude, longitude, altitude, speed,
+            ground_course, covariance))
+
+    # Returns the fix for a NAV-PVT message, False for anything else
+    def add_message(self, msg_class, msg_id, payload, timestamp):
+        if (msg_class, msg_id) != UBX_NAV_PVT:
+            return False
+        if len(payload) < NAV_PVT.size:
+            logger.debug("Short NAV-PVT message, %d bytes", len(payload))
+            return False
+        (_, _, _, _, _, _, _, _, _, _, fix_type, flags, _, NumSat, lon, lat,
+         height, _, _, _, _, _, _, speed, heading, _, _, pdop, _, _,
+         _) = NAV_PVT.unpack_from(payload)
+
+        # gnssFixOK, and a 2D, 3D or GNSS + dead reckoning fix
+        fix = bool(flags & 0x01) and 2 <= fix_type <= 4
+        return self.output(timestamp, fix, NumSat, lat * 1e-7, lon * 1e-7,
+                           height * 1e-3, speed * 1e-3,
+                           math.radians(heading * 1e-5),
+                           (pdop * 0.01) ** 2)
+
+    # Same as add_message for a complete frame, sync bytes to checksum
+    def add_frame(self, frame, timestamp):
+        frame = memoryview(frame)
+        if len(frame) < UBX_HEADER.size + 2:
+            return False
+        if ubx_checksum(frame[2:-2]) != (frame[-2], frame[-1]):
+            logger.debug("Received a UBX frame with an invalid checksum.")
+            return False
+        _, msg_class, msg_id, _ = UBX_HEADER.unpack_from(frame)
+        return self.add_message(msg_class, msg_id,
+                                frame[UBX_HEADER.size:-2], timestamp)
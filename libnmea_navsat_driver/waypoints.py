@@ -0,0 +1,129 @@
+import math
+
+from libnmea_navsat_driver.projection import EARTH_RADIUS, LocalProjector
+
+
+class WaypointSet(object):
+    """Waypoints of a mission, indexed for per-fix queries.
+
+    The waypoints ([lat, lon] pairs) are kept as east/north meters from a
+    reference point (the first waypoint, unless given) and hashed into square
+    grid cells, by default tolerance meters wide, so within() only looks at
+    the 3 x 3 cells around the fix. nearest() has its own grid, with about
+    one waypoint per cell, and looks at rings of cells around the fix until
+    no unvisited cell can hold a nearer waypoint. Either way the cost per
+    fix stays the same however many waypoints the mission has.
+
+    update() is meant to be called on every fix: it marks the waypoints
+    within tolerance as reached and returns the ones reached for the first
+    time.
+    """
+
+    def __init__(self, points, tolerance=10.0, reference=None, cell_size=None,
+                 radius=EARTH_RADIUS):
+        points = [tuple(pt) for pt in points]
+        if not points:
+            raise ValueError("A waypoint set needs at least one waypoint")
+        if reference is None:
+            reference = points[0]
+        self.projector = LocalProjector(reference[0], reference[1], radius)
+        self.tolerance = tolerance
+        self.cell_size = cell_size if cell_size is not None else tolerance
+        self.points = points
+        self.enu = [self.projector.to_enu(lat, lon) for lat, lon in points]
+        self.reached = [False]*len(points)
+        self.reached_time = [None]*len(points)
+        self.reached_count = 0
+
+        self.cells, self.bounds = self._index(self.cell_size)
+        # nearest() uses cells holding about one waypoint each, so it finds
+        # one within a ring or two however sparse or dense the mission is
+        (x0, x1, y0, y1) = self.bounds
+        area = (x1 - x0 + 1)*(y1 - y0 + 1)*self.cell_size**2
+        self.nearest_size = max(1.0, math.sqrt(area/len(points)))
+        self.nearest_cells, self.nearest_bounds = self._index(self.nearest_size)
+
+    def _index(self, size):
+        # {(ix, iy): [(index, east, north), ...]} and the range of ix and iy
+        cells = {}
+        for index, (east, north) in enumerate(self.enu):
+            key = (int(east//size), int(north//size))
+            cells.setdefault(key, []).append((index, east, north))
+        return cells, (min(key[0] for key in cells), max(key[0] for key in cells),
+                       min(key[1] for key in cells), max(key[1] for key in cells))
+
+    def __len__(self):
+        return len(self.points)
+
+    def within(self, lat, lon, tolerance=None):
+        """(index, distance) of every waypoint within tolerance meters of the
+        fix (the set's tolerance by default), nearest first"""
+        if tolerance is None:
+            tolerance = self.tolerance
+        px, py = self.projector.to_enu(lat, lon)
+        size = self.cell_size
+        x0 = int((px - tolerance)//size)
+        x1 = int((px + tolerance)//size)
+        y0 = int((py - tolerance)//size)
+        y1 = int((py + tolerance)//size)
+        found = []
+        cells = self.cells
+        ix_min, ix_max, iy_min, iy_max = self.bounds
+        for ix in range(max(x0, ix_min), min(x1, ix_max) + 1):
+            for iy in range(max(y0, iy_min), min(y1, iy_max) + 1):
+                for index, east, north in cells.get((ix, iy), ()):
+                    d = math.hypot(east - px, north - py)
+                    if d <= tolerance:
+                        found.append((d, index))
+        found.sort()
+        return [(index, d) for d, index in found]
+
+    def nearest(self, lat, lon):
+        """(index, distance) of the waypoint nearest to the fix"""
+        px, py = self.projector.to_enu(lat, lon)
+        size = self.nearest_size
+        cx = int(px//size)
+        cy = int(py//size)
+        cells = self.nearest_cells
+        ix_min, ix_max, iy_min, iy_max = self.nearest_bounds
+        best = float('inf')
+        best_index = -1
+        # Chebyshev ring k around the fix's cell; rings nearer than the
+        # occupied cells are empty, so start at the first one that reaches them
+        k = max(0, ix_min - cx, cx - ix_max, iy_min - cy, cy - iy_max)
+        k_last = max(cx - ix_min, ix_max - cx, cy - iy_min, iy_max - cy)
+        while k <= k_last:
+            for ix in range(max(cx - k, ix_min), min(cx + k, ix_max) + 1):
+                if ix == cx - k or ix == cx + k:
+                    ys = range(max(cy - k, iy_min), min(cy + k, iy_max) + 1)
+                else:
+                    ys = (cy - k, cy + k)
+                for iy in ys:
+                    for index, east, north in cells.get((ix, iy), ()):
+                        d = math.hypot(east - px, north - py)
+                        if d < best:
+                            best = d
+                            best_index = index
+            # every cell of ring k + 1 or further is at least k*size away
+            if best <= k*size:
+                break
+            k += 1
+        return best_index, best
+
+    def update(self, lat, lon, time=None):
+        """Mark the waypoints within tolerance of this fix as reached. Returns
+        the indices of the ones reached for the first time."""
+        new = []
+        for index, _ in self.within(lat, lon):
+            if not self.reached[index]:
+                self.reached[index] = True
+                self.reached_time[index] = time
+                self.reached_count += 1
+                new.append(index)
+        return new
+
+    def reset(self):
+        """Forget which waypoints have been reached"""
+        self.reached = [False]*len(self.points)
+        self.reached_time = [None]*len(self.points)
+        self.reached_count = 0
@@ -0,0 +1,130 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from libnmea_navsat_driver.async_engine import AsyncGPSEngine
+from libnmea_navsat_driver.framer import StreamDecoder
+from tests.util import gga
+
+
+class PipePort(object):
+    """Serial port stand-in reading from a pipe"""
+
+    def __init__(self, data):
+        self.read_fd, write_fd = os.pipe()
+        os.write(write_fd, data)
+        os.close(write_fd)
+        self.timeout = None
+
+    def fileno(self):
+        return self.read_fd
+
+    @property
+    def in_waiting(self):
+        # os.read returns what is there, up to this
+        return 4096
+
+    def read(self, size=1):
+        return os.read(self.read_fd, size)
+
+    def close(self):
+        os.close(self.read_fd)
+
+
+def run_engine(port, count, **kwargs):
+    fixes = []
+
+    def usrfun(*fix):
+        time.sleep(0.002)
+        fixes.append(fix)
+
+    engine = AsyncGPSEngine(port, StreamDecoder(), usrfun, clock=lambda: 0.0,
+                            **kwargs)
+
+    async def main():
+        task = asyncio.ensure_future(engine.run())
+        deadline = time.monotonic() + 5.0
+        while len(fixes) + engine.dropped['usrfun'] < count and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(main())
+    port.close()
+    return engine, fixes
+
+
+def test_block_policy_loses_no_fixes():
+    port = PipePort(b''.join(gga(s) + b'\r\n' for s in range(40)))
+    engine, fixes = run_engine(port, 40, queue_size=1, queue_policy='block',
+                               threaded_usrfun=True)
+    assert len(fixes) == 40
+    assert engine.dropped['usrfun'] == 0
+
+
+def test_latest_policy_drops_behind_a_slow_usrfun():
+    port = PipePort(b''.join(gga(s) + b'\r\n' for s in range(40)))
+    engine, fixes = run_engine(port, 40, queue_policy='latest')
+    assert engine.dropped['usrfun'] > 0
+    assert len(fixes) + engine.dropped['usrfun'] == 40
+
+
+def test_unknown_queue_policy():
+    with pytest.raises(ValueError):
+        AsyncGPSEngine(None, StreamDecoder(), print, queue_policy='newest')
+
+
+def write_capture(path, count):
+    from libnmea_navsat_driver.capture import CaptureWriter
+    capture = CaptureWriter(path)
+    for s in range(count):
+        capture.write(0.2 * s, gga(s) + b'\r\n')
+    capture.close()
+
+
+def test_replay_is_read_without_polling_and_drained_at_the_end(tmp_path):
+    from libnmea_navsat_driver.capture import ReplayPort
+    path = str(tmp_path / "capture.raw")
+    write_capture(path, 40)
+    port = ReplayPort(path)
+    fixes = []
+
+    def usrfun(*fix):
+        time.sleep(0.002)
+        fixes.append(fix)
+
+    engine = AsyncGPSEngine(port, StreamDecoder(), usrfun, clock=port.clock,
+                            queue_size=4, queue_policy='block',
+                            threaded_usrfun=True)
+    start = time.monotonic()
+    with pytest.raises(EOFError):
+        asyncio.run(engine.run())
+    # 40 reads polled every 10 ms would take 0.4 s
+    assert time.monotonic() - start < 0.3
+    assert [fix[0] for fix in fixes] == [0.2 * s for s in range(40)]
+
+
+@pytest.mark.parametrize('policy', ['drop-oldest', 'latest'])
+def test_replay_end_with_a_drop_policy(tmp_path, policy):
+    from libnmea_navsat_driver.capture import ReplayPort
+    path = str(tmp_path / "capture.raw")
+    write_capture(path, 40)
+    port = ReplayPort(path)
+    fixes = []
+
+    def usrfun(*fix):
+        time.sleep(0.002)
+        fixes.append(fix)
+
+    engine = AsyncGPSEngine(port, StreamDecoder(), usrfun, clock=port.clock,
+                            queue_size=2, queue_policy=policy,
+                            threaded_usrfun=True)
+
+    async def main():
+        await asyncio.wait_for(engine.run(), 5.0)
+
+    with pytest.raises(EOFError):
+        asyncio.run(main())
+    assert len(fixes) + engine.dropped['usrfun'] == 40
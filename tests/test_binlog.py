@@ -0,0 +1,73 @@
+import math
+
+from libnmea_navsat_driver.binlog import BinaryLogWriter, BINLOG_RECORD, \
+    pack_record, read_binary_log, csv_to_binary, binary_to_csv
+from tests.util import fix
+
+
+def test_record_size():
+    assert BINLOG_RECORD.size == 34
+
+
+def test_append_after_a_partial_record(tmp_path):
+    path = str(tmp_path / "log.bin")
+    log = BinaryLogWriter(path)
+    for i in range(3):
+        log.write(fix(i))
+    log.close()
+    # a crash in the middle of a record
+    with open(path, 'ab') as f:
+        f.write(pack_record(fix(99))[:20])
+    log = BinaryLogWriter(path)
+    log.write(fix(3))
+    log.close()
+    records = read_binary_log(path)
+    assert list(records['time']) == [fix(i)[0] for i in range(4)]
+    assert list(records['latitude']) == [fix(0)[3]] * 4
+
+
+def test_round_trip_precision(tmp_path):
+    path = str(tmp_path / "log.bin")
+    nan = float('NaN')
+    fixes = [fix(0), (0.2, False, 0, nan, nan, nan, nan, 0.0, nan),
+             (0.4, True, 12, -33.8567844, 151.2152967, -12.25, 31.5, 359.9, 1.44)]
+    log = BinaryLogWriter(path)
+    log.write(fixes[0])
+    log.write_block(fixes[1:])
+    log.close()
+    log = BinaryLogWriter(str(tmp_path / "block.bin"))
+    log.write_block(read_binary_log(path))
+    log.close()
+    for records in (read_binary_log(path), read_binary_log(str(tmp_path / "block.bin"))):
+        for record, expected in zip(records.tolist(), fixes):
+            assert record[:3] == expected[:3]
+            for value, want in zip(record[3:5], expected[3:5]):
+                assert (math.isnan(value) and math.isnan(want)) or value == want
+            for value, want in zip(record[5:], expected[5:]):
+                assert (math.isnan(value) and math.isnan(want)) or \
+                    abs(value - want) <= 1e-6 * max(1, abs(want))
+
+
+def test_csv_round_trip_keeps_the_text(tmp_path):
+    binary = str(tmp_path / "log.bin")
+    csv = str(tmp_path / "log.csv")
+    log = BinaryLogWriter(binary)
+    log.write(fix(1))
+    log.close()
+    binary_to_csv(binary, csv)
+    with open(csv) as f:
+        assert f.readlines()[1] == "0.2,True,10,40.2672305,-111.635524,1474.5,0.319,4.11,0.9801\n"
+
+
+def test_csv_to_binary_overwrites(tmp_path):
+    binary = str(tmp_path / "log.bin")
+    csv = str(tmp_path / "log.csv")
+    log = BinaryLogWriter(binary)
+    for i in range(5):
+        log.write(fix(i))
+    log.close()
+    binary_to_csv(binary, csv)
+    assert csv_to_binary(csv, binary) == 5
+    assert csv_to_binary(csv, binary) == 5
+    assert len(read_binary_log(binary)) == 5
+    assert list(read_binary_log(binary)['longitude']) == [fix(0)[4]] * 5
@@ -0,0 +1,41 @@
+import numpy as np
+
+from libnmea_navsat_driver.checksum_utils import check_nmea_checksum, \
+    check_nmea_checksum_bytes, check_nmea_checksum_batch, NMEAChecksum
+from tests.test_parser import CORPUS
+
+
+SENTENCES = CORPUS + [
+    CORPUS[0][:-1] + "0",  # wrong checksum
+    CORPUS[1][:-3],        # none
+    CORPUS[2] + "*00",     # two
+    "$*00",                # empty payload
+    "$GPGGA,1*0G",         # not hex
+    "$GPVTG,235.6,T,,M,0.319,N,0.591,K,D*0c",  # lower case hex
+]
+
+
+def test_batch_and_bytes_match_check_nmea_checksum():
+    sentences = SENTENCES
+    expected = [check_nmea_checksum(sentence) for sentence in sentences]
+    assert any(expected) and not all(expected)
+    assert [check_nmea_checksum_bytes(sentence.encode()) for sentence in sentences] == expected
+    assert list(check_nmea_checksum_batch(sentences)) == expected
+    assert list(check_nmea_checksum_batch([s.encode() for s in sentences])) == expected
+    batch = check_nmea_checksum_batch("\n".join(sentences).encode())
+    assert batch.dtype == np.bool_ and list(batch) == expected
+
+
+def test_incremental_matches_check_nmea_checksum():
+    rng = np.random.default_rng(5)
+    checksum = NMEAChecksum()
+    for sentence in SENTENCES:
+        expected = check_nmea_checksum(sentence)
+        for _ in range(5):
+            # in pieces of random size, as they come from the port
+            data = sentence.encode()
+            cuts = sorted(rng.integers(0, len(data) + 1, rng.integers(0, 4)))
+            checksum.reset()
+            for start, stop in zip([0] + cuts, cuts + [len(data)]):
+                checksum.update(memoryview(data)[start:stop])
+            assert checksum.valid() == expected, sentence
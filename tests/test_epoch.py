@@ -0,0 +1,42 @@
+from libnmea_navsat_driver.driver import NMEADriver
+from tests.util import with_checksum
+
+
+def epoch(tenths, fix_mode, hdop):
+    hhmmss = "1200%02d.%02d" % (tenths // 10, tenths % 10 * 10)
+    return [with_checksum(body).encode() for body in [
+        "GNRMC,%s,A,4016.0338,N,11138.1314,W,0.319,235.6,180918,,,A" % hhmmss,
+        "GNVTG,235.6,T,,M,0.319,N,0.591,K,A",
+        "GNGGA,%s,4016.0338,N,11138.1314,W,1,10,%.2f,1491.1,M,-16.6,M,," % (hhmmss, hdop),
+        # one GSA per constellation
+        "GNGSA,A,%d,10,32,14,18,24,,,,,,,,1.70,%.2f,1.38" % (fix_mode, hdop),
+        "GNGSA,A,%d,65,66,72,,,,,,,,,,1.70,%.2f,1.38" % (fix_mode, hdop)]]
+
+
+def test_duplicate_gsa_after_an_early_close_is_dropped():
+    driver = NMEADriver(assemble_epochs=True)
+    fixes = []
+    # 5 Hz, with a fix mode 1 (no fix) epoch in the middle
+    for i, (fix_mode, hdop) in enumerate([(3, 0.9), (3, 1.0), (3, 1.1), (1, 9.9),
+                                          (3, 1.2), (3, 1.3), (3, 1.4)]):
+        for sentence in epoch(2 * i, fix_mode, hdop):
+            fix = driver.add_sentence(sentence, float(i))
+            if fix:
+                fixes.append(fix)
+    # The first epoch only closes when the second starts; from then on each
+    # epoch closes as soon as it is complete
+    assert [fix[0] for fix in fixes] == [0.0, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0]
+    assert [fix[1] for fix in fixes] == [True, True, True, False, True, True, True]
+    assert [round(fix[8], 4) for fix in fixes] == [0.81, 1.0, 1.21, 98.01, 1.44, 1.69, 1.96]
+
+
+def test_flush_outputs_the_last_epoch():
+    driver = NMEADriver(assemble_epochs=True)
+    # nothing closes the only epoch: the sentence mix is learned when an
+    # epoch ends, and no next one starts
+    for sentence in epoch(0, 3, 1.0):
+        assert driver.add_sentence(sentence, 0.0) is False
+    fix = driver.flush()
+    assert (fix[0], fix[1], fix[8]) == (0.0, True, 1.0)
+    assert driver.flush() is False
+    assert NMEADriver().flush() is False
@@ -0,0 +1,56 @@
+import pytest
+
+from libnmea_navsat_driver.driver import NMEADriver
+from libnmea_navsat_driver.fixbuffer import FixRingBuffer
+from libnmea_navsat_driver.logwriter import CSVLogWriter, format_rows
+from tests.util import gga
+
+
+def test_view_matches_tuple_output():
+    plain = NMEADriver()
+    buffered = NMEADriver(fix_buffer=FixRingBuffer(4))
+    expected = plain.add_sentence(gga(1), 1.5)
+    view = buffered.add_sentence(gga(1), 1.5)
+    assert tuple(view) == expected
+    assert view.copy() == expected
+    assert [view[i] for i in range(len(view))] == list(expected)
+    assert view[1:3] == expected[1:3]
+    assert (view.time, view.fix, view.NumSat) == expected[:3]
+    assert type(view.time) is float and type(view.NumSat) is int
+
+
+def test_view_raises_once_overwritten():
+    buffer = FixRingBuffer(2)
+    driver = NMEADriver(fix_buffer=buffer)
+    first = driver.add_sentence(gga(1), 1.0)
+    kept = first.copy()
+    driver.add_sentence(gga(2), 2.0)
+    assert first.time == 1.0
+    driver.add_sentence(gga(3), 3.0)
+    with pytest.raises(IndexError):
+        first.time
+    assert kept[0] == 1.0
+    assert buffer.view(0).time == 3.0
+
+
+def test_last_is_oldest_first_across_the_wrap():
+    buffer = FixRingBuffer(3)
+    for i in range(5):
+        buffer.append(float(i), True, i, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+    assert list(buffer.last()['time']) == [2.0, 3.0, 4.0]
+    assert buffer.latest().time == 4.0
+
+
+def test_csv_rows_are_copied_from_views(tmp_path):
+    path = str(tmp_path / 'log.csv')
+    buffer = FixRingBuffer(1)
+    driver = NMEADriver(fix_buffer=buffer)
+    log = CSVLogWriter(path, flush_rows=10)
+    expected = []
+    for i in range(3):
+        view = driver.add_sentence(gga(i), float(i))
+        expected.append(view.copy())
+        log.write(view)
+    log.close()
+    with open(path) as f:
+        assert f.read().splitlines()[1:] == format_rows(expected).splitlines()
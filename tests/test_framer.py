@@ -0,0 +1,55 @@
+import struct
+
+from libnmea_navsat_driver.framer import StreamFramer
+from libnmea_navsat_driver.ubx import UBX_SYNC, ubx_checksum
+from tests.util import with_checksum
+
+
+def ubx_frame(msg_class, msg_id, payload):
+    body = struct.pack('<BBH', msg_class, msg_id, len(payload)) + payload
+    return UBX_SYNC + body + bytes(ubx_checksum(body))
+
+
+SENTENCES = [with_checksum(body).encode() for body in [
+    "GPGGA,120000.00,4016.0338,N,11138.1314,W,1,10,0.9,1491.1,M,-16.6,M,,",
+    "GPRMC,120000.00,A,4016.0338,N,11138.1314,W,0.319,235.6,180918,,,A"]]
+
+
+def test_false_sync_with_a_plausible_class_does_not_stall_nmea():
+    framer = StreamFramer()
+    # NAV-PVT class and id but a 1000 byte length
+    noise = UBX_SYNC + struct.pack('<BBH', 0x01, 0x07, 1000)
+    frames = framer.feed(noise + b''.join(s + b'\r\n' for s in SENTENCES))
+    assert frames == SENTENCES
+
+
+def test_false_sync_with_an_unknown_length_is_dropped_on_good_nmea():
+    framer = StreamFramer()
+    # A MON message, whose length is not fixed
+    noise = UBX_SYNC + struct.pack('<BBH', 0x0A, 0x04, 1000)
+    frames = framer.feed(noise)
+    assert frames == []
+    frames = framer.feed(SENTENCES[0] + b'\r\n')
+    assert frames == SENTENCES[:1]
+
+
+def test_ubx_frames_split_across_reads():
+    framer = StreamFramer()
+    frame = ubx_frame(0x01, 0x07, bytes(92))
+    data = SENTENCES[0] + b'\r\n' + frame + SENTENCES[1] + b'\r\n'
+    frames = []
+    for i in range(0, len(data), 7):
+        frames += framer.feed(data[i:i + 7])
+    assert frames == [SENTENCES[0], frame, SENTENCES[1]]
+    assert framer.discarded == 0
+
+
+def test_nmea_checksums_across_reads():
+    framer = StreamFramer()
+    bad = SENTENCES[0][:-1] + (b'0' if SENTENCES[0][-1:] != b'0' else b'1')
+    data = b''.join(s + b'\r\n' for s in [SENTENCES[0], bad, SENTENCES[1]])
+    for size in (1, 5, 13, len(data)):
+        frames = []
+        for i in range(0, len(data), size):
+            frames += framer.feed(data[i:i + size])
+        assert frames == SENTENCES
@@ -0,0 +1,89 @@
+import math
+
+import numpy as np
+
+from libnmea_navsat_driver.geofence import EllipseGeofence, PolygonGeofence
+from tests.util import CENTER, offset, scatter
+
+EARTH_RADIUS = 6371000.0
+DEG2RAD = math.pi/180.0
+
+
+def random_points(count, extent, seed=0):
+    return np.array(scatter(count, extent, np.random.default_rng(seed)))
+
+
+def test_ellipse_value_matches_the_formula():
+    R = [98.353826748828595, 127.49653449395105]
+    theta = -15*math.pi/180.0
+    fence = EllipseGeofence(CENTER, R, theta)
+    points = random_points(500, 300.0)
+    ct, st = math.cos(theta), math.sin(theta)
+    for lat, lon in points:
+        # gpslogger.ellipse before the fence was compiled
+        dy = EARTH_RADIUS*(lat - CENTER[0])*DEG2RAD
+        dx = EARTH_RADIUS*math.cos(CENTER[0]*DEG2RAD)*(lon - CENTER[1])*DEG2RAD
+        ell = ((dx*ct + dy*st)/R[0])**2 + ((dx*st - dy*ct)/R[1])**2
+        assert math.isclose(fence.value(lat, lon), ell, rel_tol=1e-9, abs_tol=1e-12)
+    assert np.allclose(fence.value_track(points[:, 0], points[:, 1]),
+                       [fence.value(lat, lon) for lat, lon in points])
+
+
+def make_fence(**kwargs):
+    fence = PolygonGeofence(reference=CENTER, **kwargs)
+    # a concave field with two keep-out zones, one over its edge
+    fence.add_zone([offset(e, n) for e, n in [(-200, -150), (200, -150), (200, 150),
+                                               (0, 40), (-200, 150)]], name='field')
+    fence.add_zone([offset(e, n) for e, n in [(-50, -50), (-20, -50), (-20, -20),
+                                               (-50, -20)]], keep_out=True, name='tree')
+    fence.add_zone([offset(e, n) for e, n in [(150, -180), (260, -120), (170, -60)]],
+                   keep_out=True, name='pond')
+    return fence
+
+
+def brute_force(fence, lat, lon):
+    # crossing number and distance over every edge of every zone
+    px, py = fence.projector.to_enu(lat, lon)
+    mask = 0
+    nearest = float('inf')
+    for zone, corners in enumerate(fence.polygons):
+        inside = False
+        for i, (ax, ay) in enumerate(corners):
+            bx, by = corners[(i + 1) % len(corners)]
+            if (ay > py) != (by > py) and px < ax + (py - ay)*(bx - ax)/(by - ay):
+                inside = not inside
+            dx, dy = bx - ax, by - ay
+            t = min(max(((px - ax)*dx + (py - ay)*dy)/(dx*dx + dy*dy), 0.0), 1.0)
+            nearest = min(nearest, math.hypot(px - ax - t*dx, py - ay - t*dy))
+        if inside:
+            mask |= 1 << zone
+    return mask, nearest
+
+
+def test_polygon_grid_matches_brute_force():
+    for cell_size in (None, 7.0, 60.0):
+        fence = make_fence(cell_size=cell_size)
+        # some points fall outside the grid
+        points = random_points(3000, 400.0, seed=1)
+        inside, distance, zone = fence.locate_track(points[:, 0], points[:, 1])
+        ok, margin, _ = fence.check_track(points[:, 0], points[:, 1])
+        for i, (lat, lon) in enumerate(points):
+            mask, nearest = brute_force(fence, lat, lon)
+            allowed = bool(mask & 1) and not mask & 6
+            assert fence.locate(lat, lon)[0] == mask
+            assert math.isclose(fence.locate(lat, lon)[1], nearest, abs_tol=1e-6)
+            assert fence.check(lat, lon)[0] == allowed
+            assert sum(1 << z for z in np.flatnonzero(inside[i])) == mask
+            assert math.isclose(distance[i], nearest, abs_tol=1e-6)
+            assert ok[i] == allowed
+            assert math.isclose(margin[i], nearest if allowed else -nearest, abs_tol=1e-6)
+
+
+def test_polygon_nearest_zone():
+    fence = make_fence()
+    assert fence.check(*offset(-35, -35))[::2] == (False, 'tree')
+    assert fence.check(*offset(-35, 0))[::2] == (True, 'tree')
+    assert fence.check(*offset(0, 300))[::2] == (False, 'field')
+    ok, margin, first = fence.evaluate_track([0.0, 1.0, 2.0],
+        *np.array([offset(0, -100), offset(-35, -35), offset(0, -100)]).T)
+    assert list(ok) == [True, False, True] and first == 1.0
@@ -0,0 +1,32 @@
+import os
+import time
+
+from libnmea_navsat_driver.logwriter import CSVLogWriter, RotatingLogWriter
+from tests.util import fix
+
+
+def test_rotation_counts_queued_rows(tmp_path):
+    base = str(tmp_path / "log")
+    log = RotatingLogWriter(lambda path: CSVLogWriter(path, flush_rows=50),
+                            base, ".csv", base + "-index.csv", max_bytes=2000)
+    for i in range(300):
+        log.write(fix(i))
+    log.close()
+    row = len(CSVLogWriter(os.devnull).row_format % fix(299))
+    sizes = [os.path.getsize(os.path.join(str(tmp_path), name))
+             for name in sorted(os.listdir(str(tmp_path))) if name != "log-index.csv"]
+    assert len(sizes) > 1
+    assert max(sizes) < 2000 + row
+
+
+def test_poll_flushes_without_new_rows(tmp_path):
+    path = str(tmp_path / "log.csv")
+    log = CSVLogWriter(path, flush_rows=50, flush_interval=0.01)
+    log.write(fix(0))
+    log.poll()
+    assert log.rows_written == 0
+    time.sleep(0.02)
+    log.poll()
+    assert log.rows_written == 1
+    assert os.path.getsize(path) == log.bytes_written
+    log.close()
@@ -0,0 +1,140 @@
+import calendar
+import math
+
+from libnmea_navsat_driver.driver import NMEADriver
+from libnmea_navsat_driver.parser import parse_nmea_sentence, parse_nmea_bytes, \
+    parse_nmea_batch, convert_date, UTCClock
+from tests.util import with_checksum
+
+RMC = with_checksum("GPRMC,120000.60,A,4016.0338,N,11138.1314,W,0.319,235.6,180918,,,A")
+GGA = with_checksum("GPGGA,120000.80,4016.0338,N,11138.1314,W,1,10,0.99,1491.1,M,-16.6,M,,")
+SEPT_18 = calendar.timegm((2018, 9, 18, 0, 0, 0))
+
+
+def test_rmc_time_uses_its_own_date():
+    expected = SEPT_18 + 43200.6
+    assert parse_nmea_sentence(RMC)['RMC']['utc_time'] == expected
+    assert parse_nmea_bytes(RMC.encode())['RMC']['utc_time'] == expected
+    assert parse_nmea_batch([RMC])['RMC']['utc_time'][0] == expected
+
+
+def test_clock_date_carries_to_later_sentences():
+    clock = UTCClock()
+    parse_nmea_bytes(RMC.encode(), clock)
+    assert parse_nmea_bytes(GGA.encode(), clock)['GGA']['utc_time'] == SEPT_18 + 43200.8
+
+
+def test_drivers_do_not_share_a_date():
+    dated = NMEADriver()
+    undated = NMEADriver()
+    dated.add_sentence(RMC.encode(), 0.0)
+    assert dated.clock.midnight == SEPT_18
+    assert undated.clock.midnight is None
+
+
+def test_midnight_with_rmc_first():
+    before = with_checksum("GPRMC,235959.00,A,4016.0338,N,11138.1314,W,0.3,235.6,180918,,,A")
+    after = with_checksum("GPRMC,000000.00,A,4016.0338,N,11138.1314,W,0.3,235.6,190918,,,A")
+    gga = with_checksum("GPGGA,000000.00,4016.0338,N,11138.1314,W,1,10,0.99,1491.1,M,-16.6,M,,")
+    sept_19 = SEPT_18 + 86400
+    for parse in (parse_nmea_sentence, parse_nmea_bytes):
+        clock = UTCClock()
+        lines = [before, after, gga]
+        if parse is parse_nmea_bytes:
+            lines = [line.encode() for line in lines]
+        assert parse(lines[0], clock)['RMC']['utc_time'] == SEPT_18 + 86399
+        assert parse(lines[1], clock)['RMC']['utc_time'] == sept_19
+        assert parse(lines[2], clock)['GGA']['utc_time'] == sept_19
+
+
+def test_zda_sets_the_date():
+    clock = UTCClock()
+    zda = with_checksum("GPZDA,120000.00,18,09,2018,00,00")
+    assert parse_nmea_sentence(zda, clock)['ZDA']['utc_time'] == SEPT_18 + 43200
+
+
+def test_invalid_dates_are_ignored():
+    assert math.isnan(convert_date("000000"))
+    assert math.isnan(convert_date("310218"))
+    clock = UTCClock()
+    zda = with_checksum("GPZDA,120000.00,31,02,2018,00,00")
+    parse_nmea_sentence(zda, clock)
+    assert clock.midnight != calendar.timegm((2018, 3, 3, 0, 0, 0))
+    rmc = with_checksum("GPRMC,120000.00,A,4016.0338,N,11138.1314,W,0.3,235.6,000000,,,A")
+    batch = parse_nmea_batch([rmc])['RMC']
+    assert math.isnan(batch['utc_date'][0])
+
+
+# A mix of every parsed sentence type, with empty fields, both hemispheres,
+# lower case checksums and a few that must be rejected
+CORPUS = [with_checksum(body) for body in [
+    "GPRMC,235959.80,A,4016.0338,N,11138.1314,W,0.319,235.6,180918,,,A",
+    "GNGGA,235959.80,4016.0338,N,11138.1314,W,1,10,0.99,1491.1,M,-16.6,M,,",
+    "GPGSA,A,3,10,32,14,18,24,,,,,,,,1.70,0.99,1.38",
+    "GLGSA,A,1,,,,,,,,,,,,,,,",
+    "GPGSV,3,1,11,10,63,137,17,07,61,098,15,05,59,290,20,08,54,157,30",
+    "GPGSV,3,3,11,22,42,067,42,24,14,311,43,27,05,244,00",
+    "GNVTG,235.6,T,,M,0.319,N,0.591,K,A",
+    "GPGLL,3351.2100,S,15112.5400,E,000000.20,A,A",
+    "GPZDA,000000.40,19,09,2018,00,00",
+    "GNGGA,000000.60,3351.2100,S,15112.5400,E,0,00,,,M,,M,,",
+    "GPRMC,000001.00,V,,,,,,,190918,,,N",
+    "GNGGA,,,,,,0,00,99.99,,,,,,",
+    "GPTXT,01,01,02,ANTSTATUS=OK",
+]] + [
+    "$GPVTG,235.6,T,,M,0.319,N,0.591,K,D*0c",
+    "$GPGGA,235959.80,4016.0338,N,11138.1314,W,1,10,0.99,1491.1,M,-16.6,M,,",
+    "$BDGSA,A,3,10,32,,,,,,,,,,,1.70,0.99,1.38*00",
+]
+
+
+def same(a, b):
+    if isinstance(a, float) and isinstance(b, float) and math.isnan(a):
+        return math.isnan(b)
+    return a == b
+
+
+def test_bytes_path_matches_the_regex_path():
+    text_clock = UTCClock()
+    bytes_clock = UTCClock()
+    for i, sentence in enumerate(CORPUS):
+        expected = parse_nmea_sentence(sentence, text_clock)
+        # as read from the port, or sliced out of a buffer
+        data = [sentence.encode(), bytearray(sentence.encode() + b'\n'),
+                memoryview(sentence.encode()), sentence.encode() + b'\r\n'][i % 4]
+        parsed = parse_nmea_bytes(data, bytes_clock)
+        if expected is False:
+            assert parsed is False, sentence
+            continue
+        assert list(parsed) == list(expected)
+        for sentence_type, values in expected.items():
+            fields = parsed[sentence_type]
+            assert set(fields) == set(values)
+            for name, value in values.items():
+                assert same(fields[name], value), (sentence, name)
+    assert bytes_clock.midnight == text_clock.midnight
+    # straight from serial.Serial.readline
+    assert parse_nmea_bytes(CORPUS[1].encode() + b'\r\n')['GGA']['hdop'] == 0.99
+
+
+def test_batch_matches_the_scalar_path():
+    clock = UTCClock()
+    expected = {}
+    for sentence in CORPUS:
+        parsed = parse_nmea_sentence(sentence, clock)
+        if parsed:
+            for sentence_type, values in parsed.items():
+                expected.setdefault(sentence_type, []).append(values)
+    for batch in (parse_nmea_batch(CORPUS),
+                  parse_nmea_batch("\r\n".join(CORPUS).encode())):
+        assert sorted(batch) == sorted(expected)
+        for sentence_type, rows in expected.items():
+            array = batch[sentence_type]
+            assert len(array) == len(rows)
+            for name in array.dtype.names:
+                for row, values in zip(array[name].tolist(), rows):
+                    value = values[name]
+                    if isinstance(row, bytes):
+                        row = row.decode()
+                    assert same(row, value), \
+                        (sentence_type, name, row, value)
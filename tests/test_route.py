@@ -0,0 +1,63 @@
+import math
+
+import numpy as np
+import pytest
+
+from libnmea_navsat_driver.route import RouteTracker
+from tests.util import offset
+
+
+# a zigzag survey: legs far enough apart that the nearest leg is always the
+# one being flown
+CORNERS = [(0, 0), (0, 400), (60, 400), (60, 0), (120, 0), (120, 400), (300, 600)]
+
+
+def direct(tracker, lat, lon):
+    # project the fix onto every segment of the route, keep the nearest
+    # (the later one on a tie) and measure along the route up to it
+    px, py = tracker.projector.to_enu(lat, lon)
+    enu = [tracker.projector.to_enu(*pt) for pt in tracker.points]
+    best = None
+    along = 0.0
+    for i, ((ax, ay), (bx, by)) in enumerate(zip(enu[:-1], enu[1:])):
+        length = math.hypot(bx - ax, by - ay)
+        t = min(max(((px - ax)*(bx - ax) + (py - ay)*(by - ay))/length**2, 0.0), 1.0)
+        d = math.hypot(px - ax - t*(bx - ax), py - ay - t*(by - ay))
+        # right of the direction of travel is positive
+        cross = ((px - ax)*(by - ay) - (py - ay)*(bx - ax))/length
+        if best is None or d <= best[0] + 1e-9:
+            best = (d, i, cross, along + t*length)
+        along += length
+    return best[1], best[2], best[3], along - best[3]
+
+
+def test_tracker_matches_direct_projection():
+    tracker = RouteTracker([offset(*pt) for pt in CORNERS])
+    rng = np.random.default_rng(4)
+    enu = np.array(CORNERS, dtype=float)
+    for (ax, ay), (bx, by) in zip(enu[:-1], enu[1:]):
+        for t in np.linspace(0.0, 1.0, 40, endpoint=False):
+            east, north = ax + t*(bx - ax), ay + t*(by - ay)
+            east, north = np.array([east, north]) + rng.normal(0.0, 8.0, 2)
+            lat, lon = offset(east, north)
+            segment, cross, along, to_go = tracker.update(lat, lon)
+            expected = direct(tracker, lat, lon)
+            assert segment == expected[0]
+            assert math.isclose(cross, expected[1], abs_tol=1e-6)
+            assert math.isclose(along, expected[2], abs_tol=1e-6)
+            assert math.isclose(to_go, expected[3], abs_tol=1e-6)
+    assert tracker.recoveries == 0
+    assert math.isclose(tracker.length, 400*3 + 60*2 + math.hypot(180, 200), rel_tol=1e-6)
+
+
+def test_tracker_recovers_after_a_jump():
+    tracker = RouteTracker([offset(*pt) for pt in CORNERS], search=1)
+    tracker.update(*offset(2, 100))
+    assert tracker.segment == 0
+    # far beyond the search window and the recover distance of segment 0
+    lat, lon = offset(205, 500)
+    segment, cross, along, to_go = tracker.update(lat, lon)
+    assert tracker.recoveries == 1
+    assert segment == 5
+    assert (segment, cross, along, to_go) == \
+        pytest.approx(direct(tracker, lat, lon), abs=1e-6)
@@ -0,0 +1,44 @@
+import math
+import struct
+
+from libnmea_navsat_driver.framer import StreamDecoder
+from libnmea_navsat_driver.ubx import UBX_SYNC, NAV_PVT, NAV_PVT_FIELDS, \
+    UBXDriver, ubx_checksum
+
+
+def nav_pvt_frame(**values):
+    fields = dict.fromkeys(NAV_PVT_FIELDS, 0)
+    fields.update(values)
+    payload = NAV_PVT.pack(*[fields[name] for name in NAV_PVT_FIELDS])
+    body = struct.pack('<BBH', 0x01, 0x07, len(payload)) + payload
+    return UBX_SYNC + body + bytes(ubx_checksum(body))
+
+
+FRAME = nav_pvt_frame(fixType=3, flags=0x01, numSV=12, lon=-1116355240,
+                      lat=402672305, height=1474500, gSpeed=319,
+                      headMot=4110000, pDOP=170)
+
+
+def test_nav_pvt_scaling():
+    time, fix, NumSat, lat, lon, alt, speed, course, covariance = \
+        UBXDriver().add_frame(FRAME, 12.5)
+    assert (time, fix, NumSat) == (12.5, True, 12)
+    assert math.isclose(lat, 40.2672305, abs_tol=1e-9)
+    assert math.isclose(lon, -111.635524, abs_tol=1e-9)
+    assert math.isclose(alt, 1474.5)
+    assert math.isclose(speed, 0.319)
+    assert math.isclose(course, math.radians(41.1))
+    assert math.isclose(covariance, 1.7**2)
+
+
+def test_no_fix_and_bad_frames():
+    driver = UBXDriver()
+    # gnssFixOK not set
+    assert driver.add_frame(nav_pvt_frame(fixType=3, numSV=4), 0.0)[1] is False
+    assert driver.add_frame(FRAME[:-1] + bytes([FRAME[-1] ^ 1]), 0.0) is False
+
+
+def test_nav_pvt_after_a_false_sync():
+    decoder = StreamDecoder()
+    fixes = decoder.feed(UBX_SYNC + struct.pack('<BBH', 0x01, 0x07, 1000) + FRAME, 0.0)
+    assert len(fixes) == 1 and fixes[0][2] == 12
@@ -0,0 +1,47 @@
+import math
+
+import numpy as np
+
+from libnmea_navsat_driver.waypoints import WaypointSet
+from tests.util import CENTER, scatter
+
+
+def linear_scan(waypoints, lat, lon):
+    px, py = waypoints.projector.to_enu(lat, lon)
+    return [math.hypot(east - px, north - py) for east, north in waypoints.enu]
+
+
+def test_grid_matches_linear_scan():
+    rng = np.random.default_rng(2)
+    # dense, sparse, and a dense cluster far from the rest
+    for points in (scatter(400, 200.0, rng), scatter(20, 3000.0, rng),
+                   scatter(100, 50.0, rng) + [(CENTER[0] + 0.05, CENTER[1])]):
+        waypoints = WaypointSet(points, tolerance=15.0)
+        for lat, lon in scatter(300, 4000.0, rng) + scatter(300, 100.0, rng):
+            distances = linear_scan(waypoints, lat, lon)
+            index, d = waypoints.nearest(lat, lon)
+            assert math.isclose(d, min(distances), abs_tol=1e-9)
+            assert distances[index] == d
+            for tolerance in (None, 40.0):
+                limit = 15.0 if tolerance is None else tolerance
+                expected = sorted((d, i) for i, d in enumerate(distances) if d <= limit)
+                assert waypoints.within(lat, lon, tolerance) == [(i, d) for d, i in expected]
+
+
+def test_update_reports_each_waypoint_once():
+    rng = np.random.default_rng(3)
+    points = scatter(50, 300.0, rng)
+    waypoints = WaypointSet(points, tolerance=20.0)
+    reached = {}
+    for time, (lat, lon) in enumerate(scatter(2000, 300.0, rng)):
+        new = waypoints.update(lat, lon, time)
+        distances = linear_scan(waypoints, lat, lon)
+        for i, d in enumerate(distances):
+            if d <= 20.0 and i not in reached:
+                reached[i] = time
+        assert sorted(new) == sorted(i for i, t in reached.items() if t == time)
+    assert waypoints.reached_count == len(reached)
+    assert [waypoints.reached_time[i] for i in sorted(reached)] == \
+        [reached[i] for i in sorted(reached)]
+    waypoints.reset()
+    assert waypoints.reached_count == 0 and not any(waypoints.reached)
@@ -0,0 +1,36 @@
+import math
+
+# Reference point of the position helpers, the center of the flying field
+CENTER = (40.2672305, -111.635524)
+METERS_PER_DEG = 6371000.0*math.pi/180.0
+
+
+def with_checksum(body):
+    """$body*HH with the NMEA checksum of body"""
+    checksum = 0
+    for c in body:
+        checksum ^= ord(c)
+    return "$%s*%02X" % (body, checksum)
+
+
+def gga(second):
+    """GGA sentence (bytes, no line ending) at 12:00:second"""
+    return with_checksum("GPGGA,1200%02d.00,4016.0338,N,11138.1314,W,1,10,0.99,"
+                         "1491.1,M,-16.6,M,," % second).encode()
+
+
+def fix(i):
+    """Fix tuple number i, 0.2 s apart"""
+    return (0.2 * i, True, 10, 40.2672305, -111.635524, 1474.5, 0.319, 4.11, 0.9801)
+
+
+def offset(east, north, origin=CENTER):
+    """(lat, lon) of the point east/north meters from origin"""
+    return (origin[0] + north/METERS_PER_DEG,
+            origin[1] + east/(METERS_PER_DEG*math.cos(math.radians(origin[0]))))
+
+
+def scatter(count, extent, rng):
+    """count (lat, lon) points within about extent meters of CENTER"""
+    return [offset(east, north)
+            for east, north in rng.uniform(-extent, extent, (count, 2))]